@@ -0,0 +1,71 @@
+"""Per-request cost of ProfilingMiddleware when no request is being profiled.
+
+    python benchmarks/profiling_overhead.py --requests 200000
+
+Wraps a view that does nothing, so the middleware's own cost is not hidden
+behind view, database or Flask API time. Measures it off (PROFILE_DIR unset,
+so Django drops the middleware), armed (PROFILE_TOKEN set, request not asking
+for a profile) and sampling 1 in 1000 requests. Needs no database.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nahb.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.exceptions import MiddlewareNotUsed  # noqa: E402
+from django.http import HttpResponse  # noqa: E402
+from django.test import RequestFactory, override_settings  # noqa: E402
+
+from stories.middleware import ProfilingMiddleware  # noqa: E402
+
+
+def view(request):
+    return HttpResponse('ok')
+
+
+def run(label, overrides, requests, rounds):
+    with tempfile.TemporaryDirectory() as profile_dir:
+        overrides = dict(overrides)
+        if overrides.get('PROFILE_DIR'):
+            overrides['PROFILE_DIR'] = profile_dir
+        with override_settings(**overrides):
+            try:
+                handler = ProfilingMiddleware(view)
+            except MiddlewareNotUsed:
+                handler = view
+            request = RequestFactory().get('/stories/?page=2')
+            best = float('inf')
+            for _ in range(rounds):
+                start = time.perf_counter()
+                for _ in range(requests):
+                    handler(request)
+                best = min(best, (time.perf_counter() - start) / requests)
+
+    print(f'{label:>16}: {best * 1e6:8.2f} us/request')
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200000)
+    parser.add_argument('--rounds', type=int, default=3, help='best of this many runs')
+    args = parser.parse_args()
+
+    off = run('off', {'PROFILE_DIR': None}, args.requests, args.rounds)
+    armed = run('armed', {'PROFILE_DIR': True, 'PROFILE_TOKEN': 'benchmark'}, args.requests, args.rounds)
+    sampled = run('sampling 1/1000', {'PROFILE_DIR': True, 'PROFILE_TOKEN': None, 'PROFILE_SAMPLE_RATE': 0.001},
+                  args.requests, args.rounds)
+    print(f'armed overhead: {(armed - off) * 1e6:+.2f} us/request')
+    print(f'sampling overhead: {(sampled - off) * 1e6:+.2f} us/request (includes the sampled captures)')
+
+
+if __name__ == '__main__':
+    main()
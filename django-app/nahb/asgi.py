@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nahb.settings')
 
 application = get_asgi_application()
+
+# Periodic PlaySession expiry runs only in processes that serve requests
+from stories.cleanup import start_configured_sweep  # noqa: E402
+
+start_configured_sweep()
@@ -36,13 +36,17 @@ INSTALLED_APPS = [
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
+    'whitenoise.runserver_nostatic',
     'django.contrib.staticfiles',
     'stories',
     'compressor',
 ]
 
 MIDDLEWARE = [
+    'stories.middleware.ProfilingMiddleware',
+    'stories.middleware.TimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -79,9 +83,23 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # Snapshot of 'default' used by statistics and listing views (see stories/replica.py)
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['stories.routers.ReadReplicaRouter']
+
+# Alias for aggregate/report reads; set to 'default' to read everything from the primary
+REPORTING_DB_ALIAS = 'replica'
+
+# Maximum age in seconds of the replica snapshot; older, reporting views read the primary while it refreshes
+REPLICA_MAX_STALENESS = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -125,6 +143,20 @@ STATICFILES_DIRS = [
 
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Content-hashed file names plus gzip/Brotli variants, written by collectstatic
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Any file with a content hash in its name (including django-compressor's
+# CACHE/ output) is served with Cache-Control: immutable
+WHITENOISE_IMMUTABLE_FILE_TEST = r'\.[0-9a-f]{12}\.\w+$'
+
 STATICFILES_FINDERS = [
     'django.contrib.staticfiles.finders.FileSystemFinder',
     'django.contrib.staticfiles.finders.AppDirectoriesFinder',
@@ -137,9 +169,73 @@ COMPRESS_PRECOMPILERS = (
 
 COMPRESS_ENABLED = True
 
+# SCSS is compiled once by `manage.py compress` at build time; templates only
+# look up the generated manifest and never invoke libsass per request.
+COMPRESS_OFFLINE = True
+
+# Story metadata fetched from Flask; switch the backend to
+# 'django.core.cache.backends.filebased.FileBasedCache' (with a LOCATION directory)
+# to share it between worker processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'stories': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'stories',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+
+STORY_CACHE_ALIAS = 'stories'
+STORY_CACHE_TTL = 300  # seconds an entry may live even if the catalog never changes
+STORY_CACHE_POLL_INTERVAL = 1.0  # seconds between checks of Flask's /version
+
 FLASK_API_URL = 'http://localhost:5000'
+
+# Story and page reads give Flask UPSTREAM_DEADLINE seconds; on an error or
+# timeout the last good payload is served instead, flagged as stale. The most
+# recent FALLBACK_LRU_SIZE payloads are kept in memory and every payload is
+# also saved on disk, up to FALLBACK_SPILL_MAX_BYTES (oldest removed first).
+UPSTREAM_DEADLINE = 2.0
+FALLBACK_LRU_SIZE = 500
+FALLBACK_SPILL_DIR = BASE_DIR / 'fallback_cache'
+FALLBACK_SPILL_MAX_BYTES = 50 * 1024 * 1024
+
+# Token bucket per user (or session) on the play views: bursts of up to
+# PLAY_RATE_LIMIT_BURST requests, refilled at PLAY_RATE_LIMIT_RATE per second.
+# Set the rate to None to turn limiting off.
+PLAY_RATE_LIMIT_RATE = 5.0
+PLAY_RATE_LIMIT_BURST = 30
+PLAY_RATE_LIMIT_MAX_KEYS = 10000
+# Prefetching a reachable page costs a fraction of a token, so reading quickly
+# through pages with many choices does not run the bucket dry
+PLAY_RATE_LIMIT_PREFETCH_COST = 0.25
+# Recording a page the browser swapped in draws on its own, smaller bucket
+PLAY_TRACK_RATE_LIMIT_RATE = 2.0
+PLAY_TRACK_RATE_LIMIT_BURST = 20
 FLASK_API_KEY = 'your-secret-api-key-12345'
 
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'  
-LOGOUT_REDIRECT_URL = '/login/'  
\ No newline at end of file
+LOGOUT_REDIRECT_URL = '/login/'  
+
+# Clients allowed to scrape /metrics
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Abandoned play sessions are removed by `manage.py expire_play_sessions`,
+# or in-process every PLAY_SESSION_SWEEP_INTERVAL seconds when set
+PLAY_SESSION_TTL_HOURS = 72
+PLAY_SESSION_SWEEP_BATCH_SIZE = 500
+PLAY_SESSION_SWEEP_INTERVAL = None
+
+# On-demand request profiling, off unless PROFILE_DIR is set. A request is
+# profiled when it sends PROFILE_TOKEN in an X-Profile header or ?profile=
+# parameter, or at random for a PROFILE_SAMPLE_RATE fraction of requests
+# (0.001 = 1 in 1000). PROFILER is 'cprofile' or 'pyinstrument' (if installed).
+# Only the newest PROFILE_MAX_CAPTURES captures are kept.
+PROFILE_DIR = None
+PROFILE_TOKEN = None
+PROFILE_SAMPLE_RATE = 0.0
+PROFILER = 'cprofile'
+PROFILE_MAX_CAPTURES = 200
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nahb.settings')
 
 application = get_wsgi_application()
+
+# Periodic PlaySession expiry runs only in processes that serve requests
+from stories.cleanup import start_configured_sweep  # noqa: E402
+
+start_configured_sweep()
@@ -0,0 +1,97 @@
+import struct
+from collections import Counter
+
+from django.db import connection, transaction
+
+from .models import ChoiceStat, PageStat
+
+# A play path is the sequence of page ids a session visited, stored as
+# little-endian unsigned 32-bit integers. Recording a step is one append;
+# paths are folded into PageStat/ChoiceStat counters once, when the play
+# reaches an ending or the abandoned session is expired.
+
+_ID = struct.Struct('<I')
+
+
+def pack_path(page_ids):
+    return struct.pack(f'<{len(page_ids)}I', *page_ids)
+
+
+def unpack_path(path):
+    path = bytes(path or b'')
+    return list(struct.unpack(f'<{len(path) // _ID.size}I', path))
+
+
+def append_step(path, page_id):
+    """`path` with `page_id` appended, unless the player is already on that page (reload/resume)"""
+    path = bytes(path or b'')
+    if path[-_ID.size:] == _ID.pack(page_id):
+        return path
+    return path + _ID.pack(page_id)
+
+
+def fold_paths(story_paths):
+    """Add finished paths to the counters.
+
+    `story_paths` is an iterable of (story_id, path, completed). The last page
+    of a path that was not completed counts as a drop-off.
+    """
+    visits = Counter()
+    drop_offs = Counter()
+    clicks = Counter()
+    for story_id, path, completed in story_paths:
+        page_ids = unpack_path(path)
+        if not page_ids:
+            continue
+        for page_id in page_ids:
+            visits[story_id, page_id] += 1
+        for from_page_id, to_page_id in zip(page_ids, page_ids[1:]):
+            clicks[story_id, from_page_id, to_page_id] += 1
+        if not completed:
+            drop_offs[story_id, page_ids[-1]] += 1
+
+    if not visits:
+        return
+
+    pages = PageStat._meta.db_table
+    choices = ChoiceStat._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {pages} (story_id, page_id, visits, drop_offs) VALUES (%s, %s, %s, %s) '
+            f'ON CONFLICT (story_id, page_id) DO UPDATE SET '
+            f'visits = visits + excluded.visits, drop_offs = drop_offs + excluded.drop_offs',
+            [(story_id, page_id, count, drop_offs[story_id, page_id])
+             for (story_id, page_id), count in visits.items()],
+        )
+        if clicks:
+            cursor.executemany(
+                f'INSERT INTO {choices} (story_id, from_page_id, to_page_id, clicks) VALUES (%s, %s, %s, %s) '
+                f'ON CONFLICT (story_id, from_page_id, to_page_id) DO UPDATE SET '
+                f'clicks = clicks + excluded.clicks',
+                [(story_id, from_page_id, to_page_id, count)
+                 for (story_id, from_page_id, to_page_id), count in clicks.items()],
+            )
+
+
+def story_paths_report(story_id):
+    """Per-page visits and drop-off, with click-through rate for each move out of the page"""
+    pages = {
+        stat.page_id: {
+            'page_id': stat.page_id,
+            'visits': stat.visits,
+            'drop_offs': stat.drop_offs,
+            'drop_off_rate': round(stat.drop_offs / stat.visits * 100, 1) if stat.visits else 0.0,
+            'choices': [],
+        }
+        for stat in PageStat.objects.filter(story_id=story_id).order_by('page_id')
+    }
+    for stat in ChoiceStat.objects.filter(story_id=story_id).order_by('from_page_id', '-clicks'):
+        page = pages.get(stat.from_page_id)
+        if page is None:
+            continue
+        page['choices'].append({
+            'to_page_id': stat.to_page_id,
+            'clicks': stat.clicks,
+            'click_through_rate': round(stat.clicks / page['visits'] * 100, 1) if page['visits'] else 0.0,
+        })
+    return list(pages.values())
@@ -0,0 +1,48 @@
+import time
+
+import requests
+
+from . import metrics
+
+# One pooled session so calls to the Flask API reuse keep-alive connections
+_session = requests.Session()
+
+
+class CachedResponse:
+    """The parts of a requests.Response the views use, for payloads served from a cache"""
+
+    def __init__(self, status_code, data, stale=False):
+        self.status_code = status_code
+        self.stale = stale
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+def request(method, url, **kwargs):
+    """Call the Flask API, recording the time spent against the current request"""
+    start = time.perf_counter()
+    try:
+        return _session.request(method, url, **kwargs)
+    finally:
+        metrics.record_upstream(time.perf_counter() - start)
+        if method != 'GET':
+            from . import story_cache
+            story_cache.mark_stale()
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request('PUT', url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request('DELETE', url, **kwargs)
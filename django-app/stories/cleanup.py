@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import analytics
+from .models import PlaySession
+
+logger = logging.getLogger(__name__)
+
+_sweep_thread = None
+
+
+def sweep_play_sessions(ttl=None, batch_size=None, pause=0.0):
+    """Delete PlaySessions idle for longer than `ttl`, one small transaction per batch.
+
+    Their paths are folded into the analytics counters as drop-offs first.
+
+    Returns (rows_deleted, seconds_taken).
+    """
+    ttl = ttl or timedelta(hours=settings.PLAY_SESSION_TTL_HOURS)
+    batch_size = batch_size or settings.PLAY_SESSION_SWEEP_BATCH_SIZE
+    cutoff = timezone.now() - ttl
+    start = time.perf_counter()
+    deleted = 0
+
+    while True:
+        # Each batch commits on its own so the SQLite write lock is released between batches
+        with transaction.atomic():
+            expired = PlaySession.objects.filter(updated_at__lt=cutoff)
+            rows = list(expired.order_by('updated_at').values_list('id', 'story_id', 'path')[:batch_size])
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+            # A player who moved on since the select has a fresh updated_at and is kept
+            count, _ = expired.filter(id__in=ids).delete()
+            kept = set(PlaySession.objects.filter(id__in=ids).values_list('id', flat=True)) if count < len(rows) else ()
+            analytics.fold_paths((story_id, path, False) for row_id, story_id, path in rows if row_id not in kept)
+        deleted += count
+        if len(rows) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    duration = time.perf_counter() - start
+    logger.info('Expired %d play sessions in %.3fs', deleted, duration)
+    return deleted, duration
+
+
+def start_periodic_sweep(interval):
+    """Run sweep_play_sessions every `interval` seconds on a daemon thread"""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                sweep_play_sessions()
+            except Exception:
+                logger.exception('Play session sweep failed')
+
+    thread = threading.Thread(target=run, name='play-session-sweep', daemon=True)
+    thread.start()
+    return thread
+
+
+def start_configured_sweep():
+    """Start the periodic sweep when PLAY_SESSION_SWEEP_INTERVAL is set.
+
+    Called from nahb.wsgi and nahb.asgi, so only serving processes sweep, not
+    management commands or runserver's autoreload parent.
+    """
+    global _sweep_thread
+    interval = settings.PLAY_SESSION_SWEEP_INTERVAL
+    if interval and _sweep_thread is None:
+        _sweep_thread = start_periodic_sweep(interval)
+    return _sweep_thread
@@ -0,0 +1,64 @@
+import asyncio
+import json
+import threading
+
+# In-process pub/sub for live statistics. Writers publish small counter deltas
+# after their transaction commits; each event is serialised once and handed
+# to every connected server-sent-events stream. Events only reach listeners
+# served by the same process.
+
+QUEUE_SIZE = 100
+
+
+class Broker:
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Register the calling event loop; returns a handle whose queue yields (story_id, payload)"""
+        subscription = (asyncio.get_running_loop(), asyncio.Queue(maxsize=QUEUE_SIZE))
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, story_id, event, data):
+        """Send one event to every listener; safe to call from any thread"""
+        payload = f'event: {event}\ndata: {json.dumps(data)}\n\n'
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, (story_id, payload))
+            except RuntimeError:
+                # Loop already closed; the stream's cleanup will unsubscribe it
+                pass
+
+
+def _offer(queue, item):
+    # A listener that falls this far behind loses events rather than stalling writers
+    if not queue.full():
+        queue.put_nowait(item)
+
+
+broker = Broker()
+
+
+def play_recorded(story_id, ending_page_id):
+    broker.publish(story_id, 'play', {
+        'story_id': story_id,
+        'ending_page_id': ending_page_id,
+        'plays': 1,
+    })
+
+
+def rating_changed(story_id, rating_count, stars_sum):
+    broker.publish(story_id, 'rating', {
+        'story_id': story_id,
+        'rating_count': rating_count,
+        'avg_rating': round(stars_sum / rating_count, 1) if rating_count else None,
+    })
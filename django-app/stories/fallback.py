@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import api
+
+# Last good payload for every story/page URL fetched from Flask. Recent entries
+# stay in memory, and every payload is also written to disk when it is stored
+# or changes, so the copies survive a restart. The disk copy is capped at
+# FALLBACK_SPILL_MAX_BYTES by removing the least recently written files, on a
+# background thread so lookups never wait for the directory walk. When
+# Flask errors or misses UPSTREAM_DEADLINE, the saved payload is served
+# instead, flagged as stale, so active games keep going through an incident.
+
+_lock = threading.Lock()
+_recent = OrderedDict()
+# Estimate of FALLBACK_SPILL_DIR's size: bytes written since start, corrected
+# by each scan. `scanned` is False until the first scan finishes.
+_disk = {'bytes': 0, 'scanned': False, 'pruning': False}
+
+
+def _spill_path(url):
+    name = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return os.path.join(settings.FALLBACK_SPILL_DIR, name[:2], f'{name}.json')
+
+
+def _spill_files():
+    """(mtime, size, path) of every saved payload"""
+    files = []
+    for root, _, names in os.walk(settings.FALLBACK_SPILL_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    return files
+
+
+def _prune():
+    """Delete the oldest saved payloads until the directory is under 90% of its cap"""
+    files = sorted(_spill_files())
+    total = sum(size for _, size, _ in files)
+    target = settings.FALLBACK_SPILL_MAX_BYTES * 0.9
+    for _, size, path in files:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+    return total
+
+
+def _rescan():
+    with _lock:
+        written_before = _disk['bytes']
+    try:
+        total = _prune()
+    except Exception:
+        total = None
+    with _lock:
+        if total is not None:
+            # Keep whatever was written while the scan ran
+            _disk['bytes'] = total + _disk['bytes'] - written_before
+            _disk['scanned'] = True
+        _disk['pruning'] = False
+
+
+def _spill(url, data):
+    path = _spill_path(url)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        return
+
+    with _lock:
+        _disk['bytes'] += size
+        start = not _disk['pruning'] and (
+            not _disk['scanned'] or _disk['bytes'] > settings.FALLBACK_SPILL_MAX_BYTES
+        )
+        if start:
+            _disk['pruning'] = True
+    if start:
+        threading.Thread(target=_rescan, name='fallback-prune', daemon=True).start()
+
+
+def remember(url, data):
+    with _lock:
+        changed = _recent.get(url) != data
+        _recent[url] = data
+        _recent.move_to_end(url)
+        while len(_recent) > settings.FALLBACK_LRU_SIZE:
+            _recent.popitem(last=False)
+    # Unchanged payloads are already on disk from an earlier call
+    if changed:
+        _spill(url, data)
+
+
+def lookup(url):
+    with _lock:
+        data = _recent.get(url)
+    if data is not None:
+        return data
+    try:
+        with open(_spill_path(url)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _stale(url, error):
+    data = lookup(url)
+    if data is None:
+        raise error
+    if isinstance(data, dict):
+        data = dict(data, stale=True)
+    return api.CachedResponse(200, data, stale=True)
+
+
+def get(url):
+    """GET from Flask within UPSTREAM_DEADLINE, falling back to the last good payload"""
+    try:
+        response = api.get(url, timeout=settings.UPSTREAM_DEADLINE)
+    except Exception as e:
+        return _stale(url, e)
+
+    if response.status_code == 200:
+        remember(url, response.json())
+    elif response.status_code >= 500 and lookup(url) is not None:
+        return _stale(url, None)
+    return response
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from stories.cleanup import sweep_play_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete play sessions that have not advanced within the TTL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl-hours', type=float, default=settings.PLAY_SESSION_TTL_HOURS)
+        parser.add_argument('--batch-size', type=int, default=settings.PLAY_SESSION_SWEEP_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        deleted, duration = sweep_play_sessions(
+            ttl=timedelta(hours=options['ttl_hours']),
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Reclaimed {deleted} play sessions in {duration:.3f}s'
+        ))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from stories import replica
+
+
+class Command(BaseCommand):
+    help = 'Refresh the reporting replica from the primary database'
+
+    def handle(self, *args, **options):
+        if not replica.enabled():
+            raise CommandError('REPORTING_DB_ALIAS does not name a replica database')
+        start = time.perf_counter()
+        replica.snapshot()
+        self.stdout.write(self.style.SUCCESS(
+            f'Replica refreshed in {time.perf_counter() - start:.3f}s'
+        ))
@@ -0,0 +1,156 @@
+import threading
+import time
+from contextvars import ContextVar
+
+# Prometheus default buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestTimings:
+    """Time spent in the database and in calls to the Flask API for one request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.upstream_calls = 0
+        self.upstream_time = 0.0
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self):
+        """Value for the Server-Timing response header (durations in ms)"""
+        total = self.elapsed()
+        app = max(total - self.db_time - self.upstream_time, 0.0)
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+            f'upstream;dur={self.upstream_time * 1000:.1f};desc="{self.upstream_calls} calls"',
+            f'app;dur={app * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+_current = ContextVar('request_timings', default=None)
+
+
+def start_request():
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+def record_db(duration):
+    timings = _current.get()
+    if timings is not None:
+        timings.db_queries += 1
+        timings.db_time += duration
+
+
+def record_upstream(duration):
+    timings = _current.get()
+    if timings is not None:
+        timings.upstream_calls += 1
+        timings.upstream_time += duration
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(key, list(counts), count, total) for key, (counts, count, total) in self._series.items()]
+        for key, counts, count, total in sorted(items):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_labels(key, le=str(bound))} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_labels(key, le="+Inf")} {count}')
+            lines.append(f'{self.name}_sum{_labels(key)} {total}')
+            lines.append(f'{self.name}_count{_labels(key)} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._series.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_labels(key)} {value}')
+        return lines
+
+
+def _labels(key, **extra):
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ''
+    body = ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return '{' + body + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_DURATION = Histogram('django_request_duration_seconds', 'Request latency per view.')
+DB_DURATION = Histogram('django_request_db_seconds', 'Database time per request, per view.')
+DB_QUERIES = Counter('django_db_queries_total', 'Database queries executed, per view.')
+UPSTREAM_DURATION = Histogram('django_request_upstream_seconds', 'Flask API time per request, per view.')
+UPSTREAM_CALLS = Counter('django_upstream_calls_total', 'Calls made to the Flask API, per view.')
+RESPONSES = Counter('django_responses_total', 'Responses sent, per view and status code.')
+
+REGISTRY = [REQUEST_DURATION, DB_DURATION, DB_QUERIES, UPSTREAM_DURATION, UPSTREAM_CALLS, RESPONSES]
+
+
+def observe_request(view, method, status, timings):
+    labels = {'view': view, 'method': method}
+    REQUEST_DURATION.observe(labels, timings.elapsed())
+    DB_DURATION.observe(labels, timings.db_time)
+    DB_QUERIES.inc(labels, timings.db_queries)
+    UPSTREAM_DURATION.observe(labels, timings.upstream_time)
+    UPSTREAM_CALLS.inc(labels, timings.upstream_calls)
+    RESPONSES.inc({'view': view, 'status': str(status)})
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,76 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics, profiling
+
+
+class TimingMiddleware:
+    """Record per-view latency, DB and Flask API time, and add a Server-Timing header"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings, token = metrics.start_request()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_time_query))
+                response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        metrics.observe_request(view, request.method, response.status_code, timings)
+        response['Server-Timing'] = timings.server_timing()
+        return response
+
+
+def _time_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_db(time.perf_counter() - start)
+
+
+class ProfilingMiddleware:
+    """Profile requests that send the PROFILE_TOKEN (X-Profile header or ?profile=) or are sampled"""
+
+    def __init__(self, get_response):
+        # Not installed at all unless a profile directory is configured
+        if not settings.PROFILE_DIR:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.token = settings.PROFILE_TOKEN
+        self.sample_rate = settings.PROFILE_SAMPLE_RATE
+
+    def __call__(self, request):
+        supplied = None
+        if self.token:
+            supplied = request.headers.get('X-Profile')
+            if supplied is None and 'profile=' in request.META.get('QUERY_STRING', ''):
+                supplied = request.GET.get('profile')
+        if not profiling.should_profile(supplied, self.token, self.sample_rate):
+            return self.get_response(request)
+        if not profiling.capture_lock.acquire(blocking=False):
+            return self.get_response(request)
+
+        try:
+            profile = profiling.Profile(settings.PROFILER).start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.stop()
+            match = request.resolver_match
+            name = profile.save(settings.PROFILE_DIR, match.view_name if match else 'unmatched',
+                                settings.PROFILE_MAX_CAPTURES)
+        finally:
+            profiling.capture_lock.release()
+        response['X-Profile-Id'] = name
+        return response
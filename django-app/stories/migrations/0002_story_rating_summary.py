@@ -0,0 +1,70 @@
+# Generated by Django 6.0.2 on 2026-10-19 13:47
+
+from django.db import migrations, models
+
+
+# SQLite triggers keep the summary in step with every rating write, including
+# the ON CONFLICT DO UPDATE path used by rate_story.
+TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER stories_rating_summary_insert AFTER INSERT ON stories_rating
+    BEGIN
+        INSERT INTO stories_storyratingsummary (story_id, stars_sum, rating_count)
+        VALUES (NEW.story_id, NEW.stars, 1)
+        ON CONFLICT (story_id) DO UPDATE SET
+            stars_sum = stars_sum + excluded.stars_sum,
+            rating_count = rating_count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER stories_rating_summary_update AFTER UPDATE OF stars, story_id ON stories_rating
+    BEGIN
+        UPDATE stories_storyratingsummary
+        SET stars_sum = stars_sum - OLD.stars, rating_count = rating_count - 1
+        WHERE story_id = OLD.story_id;
+        INSERT INTO stories_storyratingsummary (story_id, stars_sum, rating_count)
+        VALUES (NEW.story_id, NEW.stars, 1)
+        ON CONFLICT (story_id) DO UPDATE SET
+            stars_sum = stars_sum + excluded.stars_sum,
+            rating_count = rating_count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER stories_rating_summary_delete AFTER DELETE ON stories_rating
+    BEGIN
+        UPDATE stories_storyratingsummary
+        SET stars_sum = stars_sum - OLD.stars, rating_count = rating_count - 1
+        WHERE story_id = OLD.story_id;
+    END
+    """,
+    """
+    INSERT INTO stories_storyratingsummary (story_id, stars_sum, rating_count)
+    SELECT story_id, SUM(stars), COUNT(*) FROM stories_rating GROUP BY story_id
+    """,
+]
+
+DROP_TRIGGERS_SQL = [
+    "DROP TRIGGER IF EXISTS stories_rating_summary_insert",
+    "DROP TRIGGER IF EXISTS stories_rating_summary_update",
+    "DROP TRIGGER IF EXISTS stories_rating_summary_delete",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoryRatingSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('story_id', models.IntegerField(unique=True)),
+                ('stars_sum', models.IntegerField(default=0)),
+                ('rating_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(TRIGGERS_SQL, reverse_sql=DROP_TRIGGERS_SQL),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-19 13:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0002_story_rating_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='playsession',
+            index=models.Index(fields=['updated_at'], name='stories_pla_updated_550f2e_idx'),
+        ),
+    ]
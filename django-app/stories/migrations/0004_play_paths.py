@@ -0,0 +1,49 @@
+# Generated by Django 6.0.2 on 2026-10-19 13:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0003_playsession_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='play',
+            name='path',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='playsession',
+            name='path',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.CreateModel(
+            name='ChoiceStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('story_id', models.IntegerField()),
+                ('from_page_id', models.IntegerField()),
+                ('to_page_id', models.IntegerField()),
+                ('clicks', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('story_id', 'from_page_id', 'to_page_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PageStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('story_id', models.IntegerField()),
+                ('page_id', models.IntegerField()),
+                ('visits', models.IntegerField(default=0)),
+                ('drop_offs', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('story_id', 'page_id')},
+            },
+        ),
+    ]
@@ -6,6 +6,7 @@ class Play(models.Model):
     ending_page_id = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)  # Level 16
+    path = models.BinaryField(default=b'')  # page ids visited, packed by stories.analytics
     
     class Meta:
         ordering = ['-created_at']
@@ -20,9 +21,11 @@ class PlaySession(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    path = models.BinaryField(default=b'')  # page ids visited, packed by stories.analytics
     
     class Meta:
         unique_together = ['session_key', 'story_id']
+        indexes = [models.Index(fields=['updated_at'])]  # expiry sweeps
 
 class Rating(models.Model):
     story_id = models.IntegerField()
@@ -34,6 +37,38 @@ class Rating(models.Model):
     class Meta:
         unique_together = ['story_id', 'user']
 
+class StoryRatingSummary(models.Model):
+    """Running totals per story, kept in sync with Rating by database triggers"""
+    story_id = models.IntegerField(unique=True)
+    stars_sum = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+
+    @property
+    def average(self):
+        if not self.rating_count:
+            return None
+        return round(self.stars_sum / self.rating_count, 1)
+
+class PageStat(models.Model):
+    """Running visit and drop-off counts per page, folded in by stories.analytics"""
+    story_id = models.IntegerField()
+    page_id = models.IntegerField()
+    visits = models.IntegerField(default=0)
+    drop_offs = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['story_id', 'page_id']
+
+class ChoiceStat(models.Model):
+    """Running count of moves from one page to another, folded in by stories.analytics"""
+    story_id = models.IntegerField()
+    from_page_id = models.IntegerField()
+    to_page_id = models.IntegerField()
+    clicks = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['story_id', 'from_page_id', 'to_page_id']
+
 class Report(models.Model):
     story_id = models.IntegerField()
     user = models.ForeignKey(User, on_delete=models.CASCADE)
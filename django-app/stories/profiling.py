@@ -0,0 +1,137 @@
+import cProfile
+import hmac
+import importlib.util
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# On-demand profiling of single requests. A profiled request runs under
+# cProfile (or pyinstrument when PROFILER = 'pyinstrument' and it is
+# installed) while a background thread samples the request thread's stack
+# every millisecond. Each capture writes the profiler output plus a
+# `.collapsed` file of folded stacks that flamegraph.pl, speedscope or
+# inferno render directly, and only the newest captures are kept. See
+# ProfilingMiddleware for how requests opt in. flask-api/app/profiling.py is
+# a cProfile-only copy of this module for the Flask service.
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 0.001
+CAPTURE_EXTENSIONS = {'prof', 'txt', 'html', 'collapsed'}
+
+# Python 3.12+ allows one cProfile per process; concurrent requests skip profiling
+capture_lock = threading.Lock()
+
+
+def should_profile(supplied_token, token, sample_rate):
+    """True when the request carries the profiling token or wins the sampling draw"""
+    if token and supplied_token and hmac.compare_digest(supplied_token, token):
+        return True
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+class StackSampler(threading.Thread):
+    """Counts the stacks one thread is seen in, as folded 'outer;inner' strings"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class Profile:
+    """Profile the calling thread between start() and stop(), then save() the results"""
+
+    def __init__(self, profiler='cprofile'):
+        self.profiler = profiler
+        if profiler == 'pyinstrument' and importlib.util.find_spec('pyinstrument') is None:
+            logger.warning('pyinstrument is not installed; profiling with cProfile')
+            self.profiler = 'cprofile'
+        self.sampler = StackSampler(threading.get_ident())
+        self.duration = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.sampler.start()
+        if self.profiler == 'pyinstrument':
+            import pyinstrument
+            self._profiler = pyinstrument.Profiler(async_mode='disabled')
+            self._profiler.start()
+        else:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def stop(self):
+        if self.profiler == 'pyinstrument':
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+        self.sampler.stop()
+        self.duration = time.perf_counter() - self.started
+
+    def save(self, directory, label, keep):
+        """Write the captures to `directory`, keeping the newest `keep`; returns the file name prefix used"""
+        os.makedirs(directory, exist_ok=True)
+        label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label).strip('_') or 'request'
+        now = time.time()
+        # Millisecond timestamps keep names unique and sorting oldest first
+        name = f'{time.strftime("%Y%m%d-%H%M%S", time.localtime(now))}.{int(now * 1000) % 1000:03d}-{label}-{self.duration * 1000:.0f}ms-{os.getpid()}-{threading.get_ident()}'
+        base = os.path.join(directory, name)
+
+        if self.profiler == 'pyinstrument':
+            with open(f'{base}.html', 'w') as f:
+                f.write(self._profiler.output_html())
+        else:
+            self._profiler.dump_stats(f'{base}.prof')
+            with open(f'{base}.txt', 'w') as f:
+                stats = pstats.Stats(self._profiler, stream=f)
+                stats.sort_stats('cumulative').print_stats(40)
+        with open(f'{base}.collapsed', 'w') as f:
+            f.write(self.sampler.collapsed())
+        prune(directory, keep)
+        return name
+
+
+def prune(directory, keep):
+    """Delete all but the `keep` newest captures (each is several files sharing a prefix)"""
+    if not keep:
+        return
+    captures = {}
+    for entry in os.scandir(directory):
+        prefix, _, extension = entry.name.rpartition('.')
+        if extension in CAPTURE_EXTENSIONS and entry.is_file():
+            captures.setdefault(prefix, []).append(entry.path)
+    # Names start with the capture time, so they sort oldest first
+    for prefix in sorted(captures)[:-keep]:
+        for path in captures[prefix]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
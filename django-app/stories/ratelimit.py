@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+
+# Token buckets for the play views, one per user (or session for anonymous
+# visitors), kept in process memory. Each bucket holds up to
+# PLAY_RATE_LIMIT_BURST tokens and refills at PLAY_RATE_LIMIT_RATE per second;
+# a request spends its cost (one token unless a view says otherwise) or is
+# answered 429. Views can draw on a separate budget with its own settings
+# prefix. Only the PLAY_RATE_LIMIT_MAX_KEYS most recently seen buckets are
+# tracked.
+
+_lock = threading.Lock()
+_buckets = OrderedDict()
+
+
+def client_key(request):
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    if request.session.session_key:
+        return f'session:{request.session.session_key}'
+    return f'ip:{request.META.get("REMOTE_ADDR")}'
+
+
+def take(key, rate, burst, cost=1):
+    """Spend `cost` tokens from `key`'s bucket; returns seconds to wait, 0 when allowed"""
+    now = time.monotonic()
+    with _lock:
+        tokens, updated = _buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens >= cost:
+            tokens -= cost
+            wait = 0.0
+        else:
+            wait = (cost - tokens) / rate
+        _buckets[key] = (tokens, now)
+        # A dropped bucket was idle longest; its client just starts full again
+        while len(_buckets) > settings.PLAY_RATE_LIMIT_MAX_KEYS:
+            _buckets.popitem(last=False)
+    return wait
+
+
+def rate_limited(view=None, *, budget='PLAY_RATE_LIMIT', cost=None):
+    """Answer 429 with Retry-After when the client has used up its play budget.
+
+    `budget` is the settings prefix of the bucket (`<budget>_RATE` and
+    `<budget>_BURST`); `cost` names the setting holding the tokens one request
+    spends, one by default. Use as `@rate_limited` or `@rate_limited(...)`.
+    """
+    if view is None:
+        return lambda view: rate_limited(view, budget=budget, cost=cost)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        rate = getattr(settings, f'{budget}_RATE')
+        if rate:
+            wait = take(
+                f'{budget}:{client_key(request)}',
+                rate,
+                getattr(settings, f'{budget}_BURST'),
+                getattr(settings, cost) if cost else 1,
+            )
+            if wait:
+                response = HttpResponse('Too many requests, please slow down.', status=429, content_type='text/plain')
+                response['Retry-After'] = str(max(1, round(wait)))
+                return response
+        return view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,106 @@
+import functools
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+# Reporting views read from REPORTING_DB_ALIAS, a SQLite snapshot of the primary
+# database. A view that finds the snapshot older than REPLICA_MAX_STALENESS
+# seconds starts a refresh on a background thread and reads the primary until
+# the refresh lands, so reports are never older than that. Snapshots are
+# written to a temporary file and swapped in, so readers of the old replica
+# never block a refresh. Writes always go to the primary.
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+_snapshot_lock = threading.Lock()
+
+
+def enabled():
+    alias = settings.REPORTING_DB_ALIAS
+    return bool(alias) and alias != 'default' and alias in settings.DATABASES
+
+
+def active():
+    return getattr(_state, 'active', False)
+
+
+def _replica_path():
+    return str(settings.DATABASES[settings.REPORTING_DB_ALIAS]['NAME'])
+
+
+def age():
+    """Seconds since the last snapshot, or None if there is none yet"""
+    try:
+        return time.time() - os.path.getmtime(_replica_path())
+    except OSError:
+        return None
+
+
+def _snapshot_locked():
+    primary_path = str(settings.DATABASES['default']['NAME'])
+    replica_path = _replica_path()
+    tmp_path = f'{replica_path}.{os.getpid()}.tmp'
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(tmp_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    try:
+        # Open replica connections keep reading the file they opened
+        os.replace(tmp_path, replica_path)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+
+
+def snapshot():
+    """Copy the primary database into the replica file with the SQLite backup API"""
+    with _snapshot_lock:
+        _snapshot_locked()
+
+
+def _refresh():
+    if not _snapshot_lock.acquire(blocking=False):
+        return  # another thread is already refreshing
+    try:
+        current_age = age()
+        if current_age is None or current_age > settings.REPLICA_MAX_STALENESS:
+            _snapshot_locked()
+    except Exception:
+        logger.exception('Replica snapshot failed')
+    finally:
+        _snapshot_lock.release()
+
+
+def ensure_fresh():
+    """Start a background refresh if the replica is stale; True when it is fresh enough to read"""
+    current_age = age()
+    if current_age is not None and current_age <= settings.REPLICA_MAX_STALENESS:
+        return True
+    if not _snapshot_lock.locked():
+        threading.Thread(target=_refresh, name='replica-snapshot', daemon=True).start()
+    return False
+
+
+def read_from_replica(view):
+    """Route the view's ORM reads to the reporting replica.
+
+    Apply below @login_required so the user is loaded from the primary.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not enabled() or not ensure_fresh():
+            return view(request, *args, **kwargs)
+        _state.active = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.active = False
+    return wrapper
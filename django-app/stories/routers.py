@@ -0,0 +1,22 @@
+from django.conf import settings
+
+from . import replica
+
+
+class ReadReplicaRouter:
+    """Send reads made inside @read_from_replica views to the reporting replica"""
+
+    def db_for_read(self, model, **hints):
+        if replica.active():
+            return settings.REPORTING_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the snapshot
+        return db == 'default'
@@ -0,0 +1,75 @@
+// Live counters for the statistics page and author dashboard.
+// Listens to the server-sent events stream and applies play/rating deltas
+// to elements marked with data-story-id / data-stat.
+(function () {
+    const marker = document.getElementById('live-stats');
+    if (!marker || !window.EventSource) {
+        return;
+    }
+
+    function card(storyId) {
+        return document.querySelector('[data-story-id="' + storyId + '"]');
+    }
+
+    function stat(root, name) {
+        return root.querySelector('[data-stat="' + name + '"]');
+    }
+
+    function updatePercentages(root, plays) {
+        root.querySelectorAll('[data-ending-id]').forEach(function (row) {
+            const count = parseInt(stat(row, 'count').textContent, 10);
+            stat(row, 'percentage').textContent = (Math.round(count / plays * 1000) / 10) + '%';
+        });
+    }
+
+    function addEndingRow(root, endingId) {
+        const body = root.querySelector('tbody');
+        if (!body) {
+            return null;
+        }
+        const row = document.createElement('tr');
+        row.dataset.endingId = endingId;
+        ['Page #' + endingId, '0', '0%'].forEach(function (text, i) {
+            const cell = document.createElement('td');
+            cell.textContent = text;
+            if (i === 1) { cell.dataset.stat = 'count'; }
+            if (i === 2) { cell.dataset.stat = 'percentage'; }
+            row.appendChild(cell);
+        });
+        body.appendChild(row);
+        return row;
+    }
+
+    const source = new EventSource(marker.dataset.eventsUrl);
+
+    source.addEventListener('play', function (event) {
+        const data = JSON.parse(event.data);
+        const root = card(data.story_id);
+        if (!root) {
+            return;
+        }
+        const plays = stat(root, 'play_count');
+        const total = parseInt(plays.textContent, 10) + data.plays;
+        plays.textContent = total;
+
+        if (root.querySelector('tbody')) {
+            const row = root.querySelector('[data-ending-id="' + data.ending_page_id + '"]')
+                || addEndingRow(root, data.ending_page_id);
+            const count = stat(row, 'count');
+            count.textContent = parseInt(count.textContent, 10) + data.plays;
+            updatePercentages(root, total);
+        }
+    });
+
+    source.addEventListener('rating', function (event) {
+        const data = JSON.parse(event.data);
+        const root = card(data.story_id);
+        if (!root) {
+            return;
+        }
+        const count = stat(root, 'rating_count');
+        const average = stat(root, 'avg_rating');
+        if (count) { count.textContent = data.rating_count; }
+        if (average) { average.textContent = data.avg_rating === null ? '-' : data.avg_rating; }
+    });
+})();
@@ -0,0 +1,155 @@
+// Instant page turns during play.
+// Pages reachable from the current page are fetched ahead of time; clicking a
+// choice swaps the prefetched content in and tells Django about it afterwards.
+(function () {
+    const root = document.getElementById('play-page');
+    if (!root || !window.fetch) {
+        return;
+    }
+
+    const csrfToken = root.querySelector('input[name="csrfmiddlewaretoken"]').value;
+    const prefetched = new Map();
+    // Track POSTs run one after another so Django sees the visits in click order
+    let tracking = Promise.resolve();
+
+    function urlFor(template, pageId) {
+        return template.replace('/page/0/', '/page/' + pageId + '/');
+    }
+
+    function prefetch(pageId) {
+        if (prefetched.has(pageId)) {
+            return;
+        }
+        const request = fetch(urlFor(root.dataset.dataUrl, pageId), {credentials: 'same-origin'})
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error('prefetch failed');
+                }
+                return response.json();
+            });
+        // Keep the rejection from being reported as unhandled; the click falls back to a normal load
+        request.catch(function () {});
+        prefetched.set(pageId, request);
+    }
+
+    function track(pageId, href) {
+        // If the visit was not recorded, reload the page so Django records it
+        function reload() {
+            if (window.location.href === href) {
+                window.location.reload();
+            }
+        }
+        tracking = tracking.then(function () {
+            return fetch(urlFor(root.dataset.trackUrl, pageId), {
+                method: 'POST',
+                credentials: 'same-origin',
+                keepalive: true,
+                headers: {'X-CSRFToken': csrfToken},
+            }).then(function (response) {
+                if (!response.ok) {
+                    reload();
+                }
+            }, reload);
+        });
+    }
+
+    function link(href, className, text) {
+        const a = document.createElement('a');
+        a.href = href;
+        a.className = className;
+        a.textContent = text;
+        return a;
+    }
+
+    function render(page) {
+        root.querySelector('.page-text').textContent = page.text;
+
+        let illustration = root.querySelector('.page-illustration');
+        if (page.illustration_url) {
+            if (!illustration) {
+                illustration = document.createElement('img');
+                illustration.className = 'page-illustration';
+                illustration.alt = '';
+                illustration.sizes = '(max-width: 800px) 100vw, 800px';
+                illustration.style.cssText = 'width: 100%; height: auto; border-radius: 8px; margin-bottom: 2rem;';
+                root.insertBefore(illustration, root.querySelector('.page-text'));
+            }
+            illustration.srcset = page.illustration_srcset;
+            illustration.src = page.illustration_url;
+        } else if (illustration) {
+            illustration.remove();
+        }
+
+        const old = root.querySelectorAll('.ending-badge, .choice-buttons, h3, .ending-links');
+        old.forEach(function (node) { node.remove(); });
+
+        if (page.is_ending) {
+            const badge = document.createElement('div');
+            badge.className = 'ending-badge';
+            badge.textContent = 'The End' + (page.ending_label ? ': ' + page.ending_label : '');
+            root.appendChild(badge);
+
+            const links = document.createElement('div');
+            links.className = 'ending-links';
+            links.style.cssText = 'margin-top: 2rem; display: flex; gap: 1rem;';
+            links.appendChild(link(root.dataset.listUrl, 'btn', 'Back to Stories'));
+            links.appendChild(link(root.dataset.replayUrl, 'btn btn-success', 'Play Again'));
+            root.appendChild(links);
+            return;
+        }
+
+        const heading = document.createElement('h3');
+        heading.style.marginBottom = '1rem';
+        heading.textContent = 'What will you do?';
+        root.appendChild(heading);
+
+        const buttons = document.createElement('div');
+        buttons.className = 'choice-buttons';
+        page.choices.forEach(function (choice) {
+            const a = link(urlFor(root.dataset.pageUrl, choice.next_page_id), 'choice-btn', choice.text);
+            a.dataset.nextPageId = choice.next_page_id;
+            buttons.appendChild(a);
+        });
+        root.appendChild(buttons);
+        prefetchChoices();
+    }
+
+    function prefetchChoices() {
+        prefetched.clear();
+        root.querySelectorAll('.choice-btn').forEach(function (a) {
+            prefetch(a.dataset.nextPageId);
+        });
+    }
+
+    root.addEventListener('click', function (event) {
+        const a = event.target.closest('.choice-btn');
+        if (!a || event.metaKey || event.ctrlKey || event.shiftKey) {
+            return;
+        }
+        const pending = prefetched.get(a.dataset.nextPageId);
+        if (!pending) {
+            return;
+        }
+        event.preventDefault();
+        pending.then(function (page) {
+            if (page.stale) {
+                // Served from Django's fallback copy; a full load shows the outage notice
+                window.location.href = a.href;
+                return;
+            }
+            render(page);
+            history.pushState({pageId: page.id}, '', a.href);
+            window.scrollTo(0, 0);
+            track(page.id, a.href);
+        }, function () {
+            window.location.href = a.href;
+        });
+    });
+
+    // Swapped pages have no server-rendered history entry; let Django render them
+    window.addEventListener('popstate', function () {
+        window.location.reload();
+    });
+
+    prefetchChoices();
+})();
@@ -0,0 +1,63 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import api, fallback
+
+# Story metadata and listings fetched from Flask are cached under a key that
+# includes Flask's catalog version. Any write in Flask bumps the version, so
+# polling GET /version (at most every STORY_CACHE_POLL_INTERVAL seconds) is
+# enough to retire every stale entry at once.
+
+_version_lock = threading.Lock()
+_version = {'value': None, 'checked_at': 0.0}
+
+
+def _cache():
+    return caches[settings.STORY_CACHE_ALIAS]
+
+
+def mark_stale():
+    """Force the next lookup to re-check the version (used after writes made through Django)"""
+    with _version_lock:
+        _version['checked_at'] = 0.0
+
+
+def current_version():
+    now = time.monotonic()
+    with _version_lock:
+        if now - _version['checked_at'] < settings.STORY_CACHE_POLL_INTERVAL:
+            return _version['value']
+        _version['checked_at'] = now
+
+    try:
+        response = api.get(f"{settings.FLASK_API_URL}/version", timeout=1)
+        value = response.json()['version'] if response.status_code == 200 else None
+    except Exception:
+        value = None
+
+    with _version_lock:
+        if value is not None:
+            _version['value'] = value
+        return _version['value']
+
+
+def get(url):
+    """GET a Flask URL, serving 200 responses from the cache when the catalog is unchanged"""
+    version = current_version()
+    if version is None:
+        return fallback.get(url)
+
+    key = f'story:{version}:{url}'
+    data = _cache().get(key)
+    if data is not None:
+        return api.CachedResponse(200, data)
+
+    response = fallback.get(url)
+    if response.status_code == 200 and not getattr(response, 'stale', False):
+        data = response.json()
+        _cache().set(key, data, settings.STORY_CACHE_TTL)
+        return api.CachedResponse(200, data)
+    return response
@@ -1,3 +1,61 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from .models import Rating, StoryRatingSummary
+
+
+class StoryRatingSummaryTriggerTests(TestCase):
+    """The SQLite triggers from migration 0002 keep StoryRatingSummary in step with Rating"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='secret')
+        self.bob = User.objects.create_user('bob', password='secret')
+
+    def rate(self, user, stars, story_id=1):
+        # Same upsert as views.rate_story
+        Rating.objects.bulk_create(
+            [Rating(story_id=story_id, user=user, stars=stars)],
+            update_conflicts=True,
+            unique_fields=['story_id', 'user'],
+            update_fields=['stars', 'comment'],
+        )
+
+    def summary(self, story_id=1):
+        return StoryRatingSummary.objects.get(story_id=story_id)
+
+    def test_first_rating_creates_summary(self):
+        self.rate(self.alice, 4)
+
+        summary = self.summary()
+        self.assertEqual((summary.stars_sum, summary.rating_count), (4, 1))
+        self.assertEqual(summary.average, 4.0)
+
+    def test_rerating_replaces_previous_stars(self):
+        self.rate(self.alice, 4)
+        self.rate(self.bob, 2)
+        self.rate(self.alice, 1)
+
+        summary = self.summary()
+        self.assertEqual(Rating.objects.filter(story_id=1).count(), 2)
+        self.assertEqual((summary.stars_sum, summary.rating_count), (3, 2))
+        self.assertEqual(summary.average, 1.5)
+
+    def test_delete_removes_rating_from_summary(self):
+        self.rate(self.alice, 4)
+        self.rate(self.bob, 2)
+        Rating.objects.get(user=self.alice).delete()
+
+        summary = self.summary()
+        self.assertEqual((summary.stars_sum, summary.rating_count), (2, 1))
+
+        Rating.objects.get(user=self.bob).delete()
+        summary = self.summary()
+        self.assertEqual((summary.stars_sum, summary.rating_count), (0, 0))
+        self.assertIsNone(summary.average)
+
+    def test_summaries_are_per_story(self):
+        self.rate(self.alice, 5, story_id=1)
+        self.rate(self.alice, 3, story_id=2)
+
+        self.assertEqual(self.summary(1).stars_sum, 5)
+        self.assertEqual(self.summary(2).stars_sum, 3)
@@ -7,11 +7,14 @@ urlpatterns = [
     path('', views.story_list, name='story_list'),
     path('story/<int:story_id>/', views.story_detail, name='story_detail'),
     path('statistics/', views.statistics, name='statistics'),
+    path('statistics/events/', views.stats_events, name='stats_events'),
     path('story/<int:story_id>/rate/', views.rate_story, name='rate_story'),
     
     # Playing
     path('play/<int:story_id>/', views.play_story, name='play_story'),
     path('play/<int:story_id>/page/<int:page_id>/', views.play_page, name='play_page'),
+    path('play/<int:story_id>/page/<int:page_id>/data/', views.play_page_data, name='play_page_data'),
+    path('play/<int:story_id>/page/<int:page_id>/track/', views.play_page_track, name='play_page_track'),
     
     # Authentication
     path('register/', views.register, name='register'),  
@@ -23,4 +26,8 @@ urlpatterns = [
     path('author/story/create/', views.simple_story_create, name='story_create'),
     path('author/story/<int:story_id>/delete/', views.story_delete, name='story_delete'),
     path('author/story/<int:story_id>/edit/', views.story_edit, name='story_edit'),
+    path('author/story/<int:story_id>/publish/', views.story_publish, name='story_publish'),
+
+    # Monitoring
+    path('metrics', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,13 +1,19 @@
-import requests
+import asyncio
 from django.shortcuts import render, redirect, get_object_or_404
 from django.conf import settings
 from django.contrib import messages
 from django.db.models import Count
-from .models import Play, PlaySession, Rating
+from .models import Play, PlaySession, Rating, StoryRatingSummary
+from . import analytics, api, events, fallback, metrics, story_cache
+from .ratelimit import rate_limited
+from .replica import read_from_replica
 from django.contrib.auth import logout as auth_logout, login
 from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
 from .forms import RegisterForm
-from django.db import models
+from django.db import transaction
+from django.http import HttpResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
 
 
 FLASK_API = settings.FLASK_API_URL
@@ -18,20 +24,22 @@ def get_headers():
     return {"X-API-KEY": settings.FLASK_API_KEY}
 
 @login_required
+@read_from_replica
 def story_list(request):
     """List all published stories with ratings"""
     search_query = request.GET.get('search', '')
     
     try:
-        response = requests.get(f"{FLASK_API}/stories?status=published")
+        response = story_cache.get(f"{FLASK_API}/stories?status=published")
         stories = response.json() if response.status_code == 200 else []
+        warn_if_stale(request, response)
         
+        summaries = StoryRatingSummary.objects.in_bulk(
+            [story['id'] for story in stories], field_name='story_id'
+        )
         for story in stories:
-            ratings = Rating.objects.filter(story_id=story['id'])
-            if ratings.exists():
-                story['avg_rating'] = round(ratings.aggregate(models.Avg('stars'))['stars__avg'], 1)
-            else:
-                story['avg_rating'] = None
+            summary = summaries.get(story['id'])
+            story['avg_rating'] = summary.average if summary else None
         
         if search_query:
             stories = [s for s in stories if 
@@ -47,11 +55,13 @@ def story_list(request):
     })
 
 @login_required
+@read_from_replica
 def story_detail(request, story_id):
     """View story details with ratings"""
     try:
-        response = requests.get(f"{FLASK_API}/stories/{story_id}")
+        response = story_cache.get(f"{FLASK_API}/stories/{story_id}")
         story = response.json() if response.status_code == 200 else None
+        warn_if_stale(request, response)
     except:
         story = None
         messages.error(request, "Could not load story")
@@ -60,23 +70,22 @@ def story_detail(request, story_id):
     total_plays = plays.count()
     endings_stats = plays.values('ending_page_id').annotate(count=Count('ending_page_id'))
     
-    ratings = Rating.objects.filter(story_id=story_id).order_by('-created_at')
-    user_rating = Rating.objects.filter(story_id=story_id, user=request.user).first()
-    
-    if ratings.exists():
-        avg_rating = ratings.aggregate(models.Avg('stars'))['stars__avg']
-        avg_rating = round(avg_rating, 1)
-    else:
-        avg_rating = None
+    ratings = Rating.objects.filter(story_id=story_id).select_related('user').order_by('-created_at')
+    # Primary, so a rating just submitted shows up on the redirect back here;
+    # the summary is a single row, so the average and count match it
+    user_rating = Rating.objects.using('default').filter(story_id=story_id, user=request.user).first()
+    summary = StoryRatingSummary.objects.using('default').filter(story_id=story_id).first()
+    avg_rating = summary.average if summary else None
     
     context = {
         'story': story,
+        'path_stats': analytics.story_paths_report(story_id),
         'total_plays': total_plays,
         'endings_stats': endings_stats,
         'ratings': ratings,
         'user_rating': user_rating,
         'avg_rating': avg_rating,
-        'total_ratings': ratings.count()
+        'total_ratings': summary.rating_count if summary else 0
     }
     return render(request, 'stories/detail.html', context)
 
@@ -90,15 +99,18 @@ def rate_story(request, story_id):
         try:
             stars = int(stars)
             if 1 <= stars <= 5:
-                rating, created = Rating.objects.update_or_create(
-                    story_id=story_id,
-                    user=request.user,
-                    defaults={'stars': stars, 'comment': comment}
+                # Single INSERT ... ON CONFLICT DO UPDATE; triggers keep StoryRatingSummary in step
+                Rating.objects.bulk_create(
+                    [Rating(story_id=story_id, user=request.user, stars=stars, comment=comment)],
+                    update_conflicts=True,
+                    unique_fields=['story_id', 'user'],
+                    update_fields=['stars', 'comment'],
                 )
-                if created:
-                    messages.success(request, 'Rating submitted!')
-                else:
-                    messages.success(request, 'Rating updated!')
+                summary = StoryRatingSummary.objects.get(story_id=story_id)
+                transaction.on_commit(lambda: events.rating_changed(
+                    story_id, summary.rating_count, summary.stars_sum
+                ))
+                messages.success(request, 'Rating saved!')
             else:
                 messages.error(request, 'Invalid rating value')
         except:
@@ -106,7 +118,14 @@ def rate_story(request, story_id):
     
     return redirect('story_detail', story_id=story_id)
 
+STALE_NOTICE = "The story server isn't responding, so you're seeing a saved copy of this content."
+
+def warn_if_stale(request, response):
+    if getattr(response, 'stale', False):
+        messages.warning(request, STALE_NOTICE)
+
 @login_required
+@rate_limited
 def play_story(request, story_id):
     """Start playing a story or resume"""
     session_key = request.session.session_key or request.session.create()
@@ -119,14 +138,16 @@ def play_story(request, story_id):
         return redirect('play_page', story_id=story_id, page_id=play_session.current_page_id)
     except PlaySession.DoesNotExist:
         try:
-            response = requests.get(f"{FLASK_API}/stories/{story_id}/start")
+            response = fallback.get(f"{FLASK_API}/stories/{story_id}/start")
             if response.status_code == 200:
                 page = response.json()
+                warn_if_stale(request, response)
                 
                 PlaySession.objects.create(
                     session_key=session_key,
                     story_id=story_id,
-                    current_page_id=page['id']
+                    current_page_id=page['id'],
+                    path=analytics.pack_path([page['id']])
                 )
                 
                 return render(request, 'play/page.html', {
@@ -138,32 +159,50 @@ def play_story(request, story_id):
     
     return redirect('story_list')
 
+def record_progress(request, story_id, page):
+    """Move the player's session to a page, or record a Play when it is an ending"""
+    session_key = request.session.session_key or request.session.create()
+
+    play_session = PlaySession.objects.filter(
+        session_key=session_key,
+        story_id=story_id
+    ).first()
+
+    if not page.get('is_ending'):
+        if play_session is None:
+            PlaySession.objects.create(
+                session_key=session_key,
+                story_id=story_id,
+                current_page_id=page['id'],
+                path=analytics.pack_path([page['id']])
+            )
+        else:
+            play_session.current_page_id = page['id']
+            play_session.path = analytics.append_step(play_session.path, page['id'])
+            play_session.save(update_fields=['current_page_id', 'path', 'updated_at'])
+    else:
+        path = analytics.append_step(play_session.path if play_session else b'', page['id'])
+        if play_session is not None:
+            play_session.delete()
+
+        Play.objects.create(
+            story_id=story_id,
+            ending_page_id=page['id'],
+            path=path
+        )
+        analytics.fold_paths([(story_id, path, True)])
+        transaction.on_commit(lambda: events.play_recorded(story_id, page['id']))
+
 @login_required
+@rate_limited
 def play_page(request, story_id, page_id):
     """Display a specific page during play"""
-    session_key = request.session.session_key or request.session.create()
-    
     try:
-        response = requests.get(f"{FLASK_API}/pages/{page_id}")
+        response = fallback.get(f"{FLASK_API}/pages/{page_id}")
         if response.status_code == 200:
             page = response.json()
-            
-            if not page.get('is_ending'):
-                PlaySession.objects.update_or_create(
-                    session_key=session_key,
-                    story_id=story_id,
-                    defaults={'current_page_id': page_id}
-                )
-            else:
-                PlaySession.objects.filter(
-                    session_key=session_key,
-                    story_id=story_id
-                ).delete()
-                
-                Play.objects.create(
-                    story_id=story_id,
-                    ending_page_id=page_id
-                )
+            warn_if_stale(request, response)
+            record_progress(request, story_id, page)
             
             return render(request, 'play/page.html', {
                 'story_id': story_id,
@@ -175,6 +214,55 @@ def play_page(request, story_id, page_id):
     return redirect('story_list')
 
 @login_required
+@rate_limited(cost='PLAY_RATE_LIMIT_PREFETCH_COST')
+def play_page_data(request, story_id, page_id):
+    """Page JSON for prefetching - no session side effects"""
+    try:
+        response = fallback.get(f"{FLASK_API}/pages/{page_id}")
+    except:
+        return JsonResponse({'error': 'Could not load page'}, status=502)
+    if response.status_code != 200:
+        return JsonResponse({'error': 'Page not found'}, status=404)
+
+    page = response.json()
+    if page.get('story_id') != story_id:
+        return JsonResponse({'error': 'Page not found'}, status=404)
+
+    data = JsonResponse(page)
+    # Lets the browser answer the click from its prefetch cache; a stale copy
+    # must not outlive the outage
+    data['Cache-Control'] = 'no-store' if page.get('stale') else 'private, max-age=300'
+    return data
+
+@login_required
+@require_POST
+@rate_limited(budget='PLAY_TRACK_RATE_LIMIT')
+def play_page_track(request, story_id, page_id):
+    """Record a choice the client already rendered from prefetched data.
+
+    Has its own budget, apart from the page views; a refused track makes the
+    browser reload the page, so the visit is still recorded.
+    """
+    url = f"{FLASK_API}/pages/{page_id}"
+    # The prefetch just stored this page, so Flask is only asked on a miss
+    page = fallback.lookup(url)
+    if page is None:
+        try:
+            response = fallback.get(url)
+        except:
+            return JsonResponse({'error': 'Could not load page'}, status=502)
+        if response.status_code != 200:
+            return JsonResponse({'error': 'Page not found'}, status=404)
+        page = response.json()
+
+    if page.get('story_id') != story_id:
+        return JsonResponse({'error': 'Page not found'}, status=404)
+
+    record_progress(request, story_id, page)
+    return HttpResponse(status=204)
+
+@login_required
+@read_from_replica
 def statistics(request):
     """Show statistics for all stories"""
     story_stats = (
@@ -186,7 +274,7 @@ def statistics(request):
     stories_data = []
     for stat in story_stats:
         try:
-            response = requests.get(f"{FLASK_API}/stories/{stat['story_id']}")
+            response = story_cache.get(f"{FLASK_API}/stories/{stat['story_id']}")
             if response.status_code == 200:
                 story = response.json()
                 story["play_count"] = stat["play_count"]
@@ -218,7 +306,7 @@ def statistics(request):
 def author_dashboard(request):
     """Author dashboard - list all stories"""
     try:
-        response = requests.get(f"{FLASK_API}/stories?status=published")
+        response = story_cache.get(f"{FLASK_API}/stories?status=published")
         stories = response.json() if response.status_code == 200 else []
     except:
         stories = []
@@ -231,13 +319,13 @@ def story_create(request):
         data = {
             'title': request.POST.get('title'),
             'description': request.POST.get('description'),
-            'status': 'published'
+            'status': 'draft'
         }
         try:
-            response = requests.post(f"{FLASK_API}/stories", json=data)
+            response = api.post(f"{FLASK_API}/stories", json=data)
             if response.status_code == 201:
                 story = response.json()
-                messages.success(request, 'Story created successfully!')
+                messages.success(request, 'Story created as a draft. Add pages and choices, then publish it.')
                 return redirect('story_edit', story_id=story['id'])
         except:
             messages.error(request, 'Could not create story')
@@ -249,7 +337,7 @@ def story_create(request):
 def story_edit(request, story_id):
     """Edit an existing story"""
     try:
-        response = requests.get(f"{FLASK_API}/stories/{story_id}")
+        response = story_cache.get(f"{FLASK_API}/stories/{story_id}")
         if response.status_code != 200:
             messages.error(request, 'Story not found')
             return redirect('author_dashboard')
@@ -264,7 +352,7 @@ def story_edit(request, story_id):
             'description': request.POST.get('description')
         }
         try:
-            response = requests.put(f"{FLASK_API}/stories/{story_id}", json=data, headers=get_headers())
+            response = api.put(f"{FLASK_API}/stories/{story_id}", json=data, headers=get_headers())
             if response.status_code == 200:
                 messages.success(request, 'Story updated successfully!')
                 return redirect('author_dashboard')
@@ -273,7 +361,13 @@ def story_edit(request, story_id):
         except:
             messages.error(request, 'Error updating story')
     
-    return render(request, 'author/story_edit.html', {'story': story})
+    try:
+        response = api.get(f"{FLASK_API}/stories/{story_id}/validation")
+        validation = response.json() if response.status_code == 200 else None
+    except:
+        validation = None
+    
+    return render(request, 'author/story_edit.html', {'story': story, 'validation': validation})
 
 
 def page_create(request, story_id):
@@ -285,9 +379,10 @@ def page_create(request, story_id):
             "ending_label": request.POST.get("ending_label", ""),
         }
         try:
-            response = requests.post(f"{FLASK_API}/stories/{story_id}/pages", json=data)
+            response = api.post(f"{FLASK_API}/stories/{story_id}/pages", json=data)
             if response.status_code == 201:
                 messages.success(request, "Page created!")
+                warn_if_unpublished(request, response)
                 return redirect("story_edit", story_id=story_id)
         except:
             messages.error(request, "Could not create page")
@@ -303,9 +398,10 @@ def choice_create(request, page_id):
             "next_page_id": request.POST.get("next_page_id"),
         }
         try:
-            response = requests.post(f"{FLASK_API}/pages/{page_id}/choices", json=data)
+            response = api.post(f"{FLASK_API}/pages/{page_id}/choices", json=data)
             if response.status_code == 201:
                 messages.success(request, "Choice created!")
+                warn_if_unpublished(request, response)
         except:
             messages.error(request, "Could not create choice")
 
@@ -316,7 +412,7 @@ def story_delete(request, story_id):
     """Delete a story"""
     if request.method == 'POST':
         try:
-            response = requests.delete(f"{FLASK_API}/stories/{story_id}")
+            response = api.delete(f"{FLASK_API}/stories/{story_id}")
             if response.status_code == 204:
                 messages.success(request, 'Story deleted!')
             else:
@@ -326,16 +422,28 @@ def story_delete(request, story_id):
     
     return redirect('author_dashboard')
 
+def warn_if_unpublished(request, response):
+    """Flask moves a published story back to draft when an edit leaves it invalid"""
+    if response.headers.get('X-Story-Status') == 'draft':
+        messages.warning(request, 'This change left the story incomplete, so it is a draft again. '
+                                  'Fix the problems listed on the edit page and publish it again.')
+
+@login_required
 def story_publish(request, story_id):
     """Publish a draft story"""
     if request.method == 'POST':
         try:
-            response = requests.put(
+            response = api.put(
                 f"{FLASK_API}/stories/{story_id}",
                 json={'status': 'published'}
             )
             if response.status_code == 200:
                 messages.success(request, 'Story published!')
+            elif response.status_code == 400:
+                report = response.json().get('validation') or {}
+                messages.error(request, 'Fix these problems before publishing:')
+                for problem in report.get('errors', []):
+                    messages.error(request, problem['message'])
         except:
             messages.error(request, 'Could not publish story')
     
@@ -344,7 +452,7 @@ def story_publish(request, story_id):
 def preview_story(request, story_id):
     """Preview a story without recording stats"""
     try:
-        response = requests.get(f"{FLASK_API}/stories/{story_id}/start")
+        response = api.get(f"{FLASK_API}/stories/{story_id}/start")
         if response.status_code == 200:
             page = response.json()
             return render(request, 'play/preview_page.html', {
@@ -360,7 +468,7 @@ def preview_story(request, story_id):
 def preview_page(request, story_id, page_id):
     """Preview a specific page"""
     try:
-        response = requests.get(f"{FLASK_API}/pages/{page_id}")
+        response = api.get(f"{FLASK_API}/pages/{page_id}")
         if response.status_code == 200:
             page = response.json()
             return render(request, 'play/preview_page.html', {
@@ -380,33 +488,39 @@ def simple_story_create(request):
         story_data = {
             'title': request.POST.get('title'),
             'description': request.POST.get('description'),
-            'status': 'published'
+            'status': 'draft'
         }
         
         try:
-            story_response = requests.post(f"{FLASK_API}/stories", json=story_data, headers=get_headers())
+            story_response = api.post(f"{FLASK_API}/stories", json=story_data, headers=get_headers())
             story = story_response.json()
             
             page1_data = {'text': request.POST.get('page1_text'), 'is_ending': False}
-            page1_response = requests.post(f"{FLASK_API}/stories/{story['id']}/pages", json=page1_data, headers=get_headers())
+            page1_response = api.post(f"{FLASK_API}/stories/{story['id']}/pages", json=page1_data, headers=get_headers())
             page1 = page1_response.json()
             
             page2_data = {'text': request.POST.get('page2_text'), 'is_ending': False}
-            page2_response = requests.post(f"{FLASK_API}/stories/{story['id']}/pages", json=page2_data, headers=get_headers())
+            page2_response = api.post(f"{FLASK_API}/stories/{story['id']}/pages", json=page2_data, headers=get_headers())
             page2 = page2_response.json()
             
             ending1_data = {'text': request.POST.get('ending1_text'), 'is_ending': True, 'ending_label': request.POST.get('ending1_label')}
-            ending1_response = requests.post(f"{FLASK_API}/stories/{story['id']}/pages", json=ending1_data, headers=get_headers())
+            ending1_response = api.post(f"{FLASK_API}/stories/{story['id']}/pages", json=ending1_data, headers=get_headers())
             ending1 = ending1_response.json()
             
             ending2_data = {'text': request.POST.get('ending2_text'), 'is_ending': True, 'ending_label': request.POST.get('ending2_label')}
-            ending2_response = requests.post(f"{FLASK_API}/stories/{story['id']}/pages", json=ending2_data, headers=get_headers())
+            ending2_response = api.post(f"{FLASK_API}/stories/{story['id']}/pages", json=ending2_data, headers=get_headers())
             ending2 = ending2_response.json()
             
-            requests.post(f"{FLASK_API}/pages/{page1['id']}/choices", json={'text': request.POST.get('choice1_text'), 'next_page_id': page2['id']}, headers=get_headers())
-            requests.post(f"{FLASK_API}/pages/{page1['id']}/choices", json={'text': request.POST.get('choice2_text'), 'next_page_id': ending1['id']}, headers=get_headers())
-            requests.post(f"{FLASK_API}/pages/{page2['id']}/choices", json={'text': request.POST.get('choice3_text'), 'next_page_id': ending1['id']}, headers=get_headers())
-            requests.post(f"{FLASK_API}/pages/{page2['id']}/choices", json={'text': request.POST.get('choice4_text'), 'next_page_id': ending2['id']}, headers=get_headers())
+            api.post(f"{FLASK_API}/pages/{page1['id']}/choices", json={'text': request.POST.get('choice1_text'), 'next_page_id': page2['id']}, headers=get_headers())
+            api.post(f"{FLASK_API}/pages/{page1['id']}/choices", json={'text': request.POST.get('choice2_text'), 'next_page_id': ending1['id']}, headers=get_headers())
+            api.post(f"{FLASK_API}/pages/{page2['id']}/choices", json={'text': request.POST.get('choice3_text'), 'next_page_id': ending1['id']}, headers=get_headers())
+            api.post(f"{FLASK_API}/pages/{page2['id']}/choices", json={'text': request.POST.get('choice4_text'), 'next_page_id': ending2['id']}, headers=get_headers())
+            
+            # Published only once the whole graph exists and passes validation
+            publish_response = api.put(f"{FLASK_API}/stories/{story['id']}", json={'status': 'published'}, headers=get_headers())
+            if publish_response.status_code != 200:
+                messages.warning(request, 'Story saved as a draft; fix the problems on its edit page to publish it.')
+                return redirect('story_edit', story_id=story['id'])
             
             messages.success(request, 'Story created successfully!')
             return redirect('author_dashboard')
@@ -419,11 +533,24 @@ def simple_story_create(request):
 def author_dashboard(request):
     """Author dashboard - requires login"""
     try:
-        response = requests.get(f"{FLASK_API}/stories")
+        response = story_cache.get(f"{FLASK_API}/stories")
         stories = response.json() if response.status_code == 200 else []
     except:
         stories = []
     
+    story_ids = [story['id'] for story in stories]
+    play_counts = dict(
+        Play.objects.filter(story_id__in=story_ids)
+        .values_list('story_id')
+        .annotate(count=Count('id'))
+    )
+    summaries = StoryRatingSummary.objects.in_bulk(story_ids, field_name='story_id')
+    for story in stories:
+        summary = summaries.get(story['id'])
+        story['play_count'] = play_counts.get(story['id'], 0)
+        story['rating_count'] = summary.rating_count if summary else 0
+        story['avg_rating'] = summary.average if summary else None
+    
     return render(request, 'author/dashboard.html', {'stories': stories})
 
 @login_required
@@ -454,4 +581,43 @@ def user_logout(request):
     """Logout user"""
     auth_logout(request)
     messages.success(request, 'Logged out successfully!')
-    return redirect('login')
\ No newline at end of file
+    return redirect('login')
+
+def metrics_view(request):
+    """Prometheus metrics - local scrapes only"""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+async def stats_events(request):
+    """Server-sent events with live play and rating deltas (?story=<id> to filter)"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=403)
+    if not isinstance(request, ASGIRequest):
+        # WSGI collects the whole stream before sending it, and this one never ends.
+        # 204 tells EventSource to stop reconnecting; the page keeps its initial numbers.
+        return HttpResponse(status=204)
+    story_filter = request.GET.get('story')
+    story_filter = int(story_filter) if story_filter and story_filter.isdigit() else None
+
+    async def stream():
+        subscription = events.broker.subscribe()
+        _, queue = subscription
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    story_id, payload = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                if story_filter is None or story_id == story_filter:
+                    yield payload
+        finally:
+            events.broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,20 +1,43 @@
+import os
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 
 db = SQLAlchemy()
 
-def create_app():
-    app = Flask(__name__)
+def create_app(config=None, instance_path=None):
+    app = Flask(__name__, instance_path=instance_path)
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///stories.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['ILLUSTRATION_ROOT'] = os.path.join(app.instance_path, 'illustrations')
+    app.config['THUMBNAIL_CACHE_DIR'] = os.path.join(app.instance_path, 'thumbnails')
+    app.config['PUBLIC_URL'] = os.environ.get('PUBLIC_URL')  # base URL browsers use to reach this API
+    app.config['THUMBNAIL_SIGNING_KEY'] = os.environ.get('THUMBNAIL_SIGNING_KEY')  # signs thumbnail URLs; random per instance if unset
+    app.config['METRICS_ALLOWED_IPS'] = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')  # clients allowed to scrape /metrics
+    app.config['STORY_SHARDS'] = int(os.environ.get('STORY_SHARDS', 1))  # >1 splits stories across SQLite files
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR')  # set to allow request profiling (app/profiling.py)
+    app.config['PROFILE_TOKEN'] = os.environ.get('PROFILE_TOKEN')  # X-Profile header / ?profile= value that profiles a request
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))  # e.g. 0.001 = 1 in 1000 requests
+    app.config['PROFILE_MAX_CAPTURES'] = int(os.environ.get('PROFILE_MAX_CAPTURES', 200))  # older captures are deleted
+    app.config.update(config or {})
     
     db.init_app(app)
     CORS(app)
+
+    from app import images, metrics, profiling, schema, shards, snapshot, textstore
+    images.init_app(app)
+    profiling.init_app(app)
+    metrics.init_app(app)
+    textstore.init_app(app)
+    snapshot.init_app(app)
     
     with app.app_context():
         from app import routes
         app.register_blueprint(routes.bp)
         db.create_all()
+        textstore.upgrade_schema(db.engine, app.config['TEXT_COMPRESS_THRESHOLD'])
+        schema.upgrade_schema(db.engine)
+        shards.init_app(app)
     
     return app
\ No newline at end of file
@@ -0,0 +1,157 @@
+from sqlalchemy import select
+
+from app import shards
+from app.models import Choice, Page
+
+# PATCH /stories/<id>/graph applies a list of page and choice operations to one
+# story in a single transaction. A created page may carry a "ref" name that
+# later operations use in place of its id. Each delete is one statement; the
+# database's ON DELETE CASCADE removes the choices that depended on it.
+
+# Field -> (JSON type, may be null)
+PAGE_FIELDS = {
+    'text': (str, False),
+    'is_ending': (bool, False),
+    'ending_label': (str, True),
+    'illustration': (str, True),
+}
+TYPE_NAMES = {str: 'a string', bool: 'true or false'}
+
+
+class GraphError(Exception):
+    """An operation that cannot be applied; the whole batch is rolled back"""
+
+
+def _is_id(value):
+    # bool is an int subclass, but true/false are never ids
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class Batch:
+    def __init__(self, session, story):
+        self.session = session
+        self.story = story
+        self.shard = shards.shard_for(story.id)
+        self.refs = {}
+        self.created_page_ids = []
+
+    def page_id(self, value):
+        """Resolve a page id or the ref of a page created earlier in the batch"""
+        if isinstance(value, str):
+            if value not in self.refs:
+                raise GraphError(f'Unknown page ref {value!r}')
+            return self.refs[value]
+        if not _is_id(value):
+            raise GraphError('Page ids must be integers or refs')
+        return value
+
+    def page(self, value):
+        page = self.session.get(Page, self.page_id(value))
+        if page is None or page.story_id != self.story.id:
+            raise GraphError(f'Page {value!r} is not part of story {self.story.id}')
+        return page
+
+    def choice(self, id):
+        choice = self.session.get(Choice, id) if _is_id(id) else None
+        if choice is None or choice.page.story_id != self.story.id:
+            raise GraphError(f'Choice {id!r} is not part of story {self.story.id}')
+        return choice
+
+    def set_page_fields(self, page, op):
+        for field, (types, nullable) in PAGE_FIELDS.items():
+            if field not in op:
+                continue
+            value = op[field]
+            if not (isinstance(value, types) or (nullable and value is None)):
+                raise GraphError(f'Page {field} must be {TYPE_NAMES[types]}{" or null" if nullable else ""}')
+            setattr(page, field, value)
+
+    def create_page(self, op):
+        if not op.get('text'):
+            raise GraphError('New pages need text')
+        page = Page(story_id=self.story.id)
+        self.set_page_fields(page, op)
+        shards.add(self.session, page, self.shard)
+        if op.get('ref') is not None:
+            self.refs[str(op['ref'])] = page.id
+        self.created_page_ids.append(page.id)
+
+    def update_page(self, op):
+        page = self.page(op.get('id'))
+        self.set_page_fields(page, op)
+        if not page.text:
+            raise GraphError('Pages need text')
+
+    def delete_page(self, op):
+        page_id = self.page_id(op.get('id'))
+        deleted = (
+            self.session.query(Page)
+            .filter(Page.id == page_id, Page.story_id == self.story.id)
+            .delete(synchronize_session=False)
+        )
+        if not deleted:
+            raise GraphError(f'Page {op.get("id")!r} is not part of story {self.story.id}')
+        if page_id in self.created_page_ids:
+            self.created_page_ids.remove(page_id)
+        # Cascades ran in SQLite; reload anything the session still holds
+        self.session.expire_all()
+
+    def create_choice(self, op):
+        if not op.get('text') or not isinstance(op['text'], str):
+            raise GraphError('New choices need text')
+        choice = Choice(
+            page_id=self.page(op.get('page_id')).id,
+            text=op['text'],
+            next_page_id=self.page(op.get('next_page_id')).id
+        )
+        shards.add(self.session, choice, self.shard)
+
+    def update_choice(self, op):
+        choice = self.choice(op.get('id'))
+        if 'text' in op:
+            if not op['text'] or not isinstance(op['text'], str):
+                raise GraphError('Choices need text')
+            choice.text = op['text']
+        if 'next_page_id' in op:
+            choice.next_page_id = self.page(op['next_page_id']).id
+
+    def delete_choice(self, op):
+        if not _is_id(op.get('id')):
+            raise GraphError('Choice ids must be integers')
+        story_pages = select(Page.id).where(Page.story_id == self.story.id)
+        deleted = (
+            self.session.query(Choice)
+            .filter(Choice.id == op.get('id'), Choice.page_id.in_(story_pages))
+            .delete(synchronize_session=False)
+        )
+        if not deleted:
+            raise GraphError(f'Choice {op.get("id")!r} is not part of story {self.story.id}')
+        self.session.expire_all()
+
+
+def apply(session, story, operations, start_page_id=None):
+    """Apply `operations` to `story` without committing; returns {ref: new page id}.
+
+    Each operation is {"op": "create" | "update" | "delete", "type": "page" | "choice", ...}
+    with the fields of the matching single-item endpoint.
+    """
+    if not isinstance(operations, list):
+        raise GraphError('operations must be a list')
+
+    shards.lock_for_write(session)
+    batch = Batch(session, story)
+    for index, op in enumerate(operations):
+        handler = None
+        if isinstance(op, dict) and op.get('op') in ('create', 'update', 'delete') \
+                and op.get('type') in ('page', 'choice'):
+            handler = getattr(batch, f"{op['op']}_{op['type']}")
+        if handler is None:
+            raise GraphError(f'Operation {index} needs an op (create/update/delete) and a type (page/choice)')
+        handler(op)
+
+    if start_page_id is not None:
+        story.start_page_id = batch.page(start_page_id).id
+    elif story.start_page_id is None and batch.created_page_ids:
+        story.start_page_id = batch.created_page_ids[0]
+    session.flush()
+    return batch.refs
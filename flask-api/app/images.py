@@ -0,0 +1,209 @@
+import hashlib
+import hmac
+import io
+import ipaddress
+import logging
+import os
+import secrets
+import socket
+import time
+import urllib.parse
+import urllib.request
+
+from flask import current_app, url_for
+from werkzeug.security import safe_join
+
+from PIL import Image
+
+THUMBNAIL_WIDTHS = (320, 640, 1024)
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+FETCH_TIMEOUT = 5
+SOURCE_REVALIDATE_SECONDS = 300  # how long a source's digest is trusted before it is read again
+
+logger = logging.getLogger(__name__)
+
+
+class ImageError(Exception):
+    """The illustration could not be loaded or decoded"""
+
+
+def _cache_dir(*parts):
+    path = os.path.join(current_app.config['THUMBNAIL_CACHE_DIR'], *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _check_host(url):
+    """Refuse URLs whose host resolves to a loopback, private or otherwise non-public address"""
+    host = urllib.parse.urlsplit(url).hostname
+    if not host:
+        raise ImageError(f'No host in {url}')
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except (OSError, UnicodeError) as e:
+        raise ImageError(f'Could not resolve {host}: {e}')
+    for address in addresses:
+        if not ipaddress.ip_address(address.split('%')[0]).is_global:
+            raise ImageError(f'{url} points at a non-public address')
+
+
+class _CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Apply the same host check to every redirect target"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        _check_host(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+_opener = urllib.request.build_opener(_CheckedRedirectHandler)
+
+
+def _read_source(src):
+    """Raw bytes of an illustration given as an http(s) URL or a path under ILLUSTRATION_ROOT"""
+    if src.startswith(('http://', 'https://')):
+        # Illustrations come from the unauthenticated write API, so never let
+        # one point the server at itself or its internal network
+        _check_host(src)
+        try:
+            with _opener.open(src, timeout=FETCH_TIMEOUT) as response:
+                data = response.read(MAX_SOURCE_BYTES + 1)
+        except (OSError, ValueError) as e:
+            raise ImageError(f'Could not fetch {src}: {e}')
+    else:
+        path = safe_join(current_app.config['ILLUSTRATION_ROOT'], src.lstrip('/'))
+        if path is None or not os.path.isfile(path):
+            raise ImageError(f'No such illustration: {src}')
+        with open(path, 'rb') as f:
+            data = f.read(MAX_SOURCE_BYTES + 1)
+
+    if len(data) > MAX_SOURCE_BYTES:
+        raise ImageError('Illustration too large')
+    return data
+
+
+def _check_image(src, data):
+    """Refuse anything Pillow cannot identify, so only images reach the cache"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ImageError(f'{src} is not an image: {e}')
+
+
+def _index_path(src):
+    src_key = hashlib.sha256(src.encode('utf-8')).hexdigest()
+    return os.path.join(_cache_dir('sources'), src_key)
+
+
+def cached_digest(src):
+    """Digest recorded for `src` within the last SOURCE_REVALIDATE_SECONDS, without reading it"""
+    index_path = _index_path(src)
+    try:
+        if time.time() - os.path.getmtime(index_path) > SOURCE_REVALIDATE_SECONDS:
+            return None
+        with open(index_path) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def source_digest(src):
+    """SHA-256 of the illustration's bytes; the source is read again once its digest expires"""
+    digest = cached_digest(src)
+    if digest:
+        return digest
+
+    data = _read_source(src)
+    _check_image(src, data)
+    digest = hashlib.sha256(data).hexdigest()
+    original_path = os.path.join(_cache_dir('originals', digest[:2]), digest)
+    if not os.path.exists(original_path):
+        _write_atomic(original_path, data)
+    _write_atomic(_index_path(src), digest.encode('ascii'))
+    return digest
+
+
+def thumbnail(src, width):
+    """Path and ETag of a WebP thumbnail of `src` resized to `width` pixels"""
+    if width not in THUMBNAIL_WIDTHS:
+        raise ValueError(f'Unsupported thumbnail width: {width}')
+
+    digest = source_digest(src)
+    etag = f'{digest}-{width}'
+    path = os.path.join(_cache_dir('thumbnails', digest[:2]), f'{etag}.webp')
+    if os.path.exists(path):
+        return path, etag
+
+    original_path = os.path.join(_cache_dir('originals', digest[:2]), digest)
+    try:
+        with Image.open(original_path) as image:
+            image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+            if image.width > width:
+                height = round(image.height * width / image.width)
+                image = image.resize((width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, 'WEBP', quality=80, method=4)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ImageError(f'Could not decode {src}: {e}')
+
+    _write_atomic(path, buffer.getvalue())
+    return path, etag
+
+
+def _write_atomic(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+# Thumbnail URLs are signed so the endpoint only ever fetches illustrations
+# this API handed out itself, never an arbitrary URL a client makes up.
+
+def signature(src):
+    key = current_app.config['THUMBNAIL_SIGNING_KEY'].encode('utf-8')
+    return hmac.new(key, src.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+
+def check_signature(src, sig):
+    return bool(sig) and hmac.compare_digest(signature(src), sig)
+
+
+def thumbnail_url(src, width=640):
+    """Absolute URL of one thumbnail, or None without an illustration.
+
+    `v` is the source's content digest when it is known, so a replaced
+    illustration gets a new URL instead of the year-long cached one.
+    """
+    if not src:
+        return None
+    params = {'width': width, 'src': src, 'sig': signature(src)}
+    version = cached_digest(src)
+    if version:
+        params['v'] = version
+    base_url = current_app.config.get('PUBLIC_URL')
+    if base_url:
+        return base_url.rstrip('/') + url_for('api.get_thumbnail', **params)
+    return url_for('api.get_thumbnail', _external=True, **params)
+
+
+def srcset(src):
+    """`srcset` attribute value listing every thumbnail width, or None without an illustration"""
+    if not src:
+        return None
+    return ', '.join(f'{thumbnail_url(src, width)} {width}w' for width in THUMBNAIL_WIDTHS)
+
+
+def init_app(app):
+    """Without THUMBNAIL_SIGNING_KEY, use a random key kept in the instance folder"""
+    if app.config.get('THUMBNAIL_SIGNING_KEY'):
+        return
+    path = os.path.join(app.instance_path, 'thumbnail.key')
+    os.makedirs(app.instance_path, exist_ok=True)
+    try:
+        with open(path, 'x') as f:
+            f.write(secrets.token_hex(32))
+    except FileExistsError:
+        pass
+    with open(path) as f:
+        app.config['THUMBNAIL_SIGNING_KEY'] = f.read().strip()
@@ -0,0 +1,158 @@
+import threading
+import time
+
+from flask import Response, abort, current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Prometheus default buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = [(key, list(counts), count, total) for key, (counts, count, total) in self._series.items()]
+        for key, counts, count, total in sorted(items):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_labels(key, le=str(bound))} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_labels(key, le="+Inf")} {count}')
+            lines.append(f'{self.name}_sum{_labels(key)} {total}')
+            lines.append(f'{self.name}_count{_labels(key)} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._series.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_labels(key)} {value}')
+        return lines
+
+
+def _labels(key, **extra):
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ''
+    body = ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return '{' + body + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_DURATION = Histogram('flask_request_duration_seconds', 'Request latency per endpoint.')
+DB_DURATION = Histogram('flask_request_db_seconds', 'Database time per request, per endpoint.')
+DB_QUERIES = Counter('flask_db_queries_total', 'Database queries executed, per endpoint.')
+RESPONSES = Counter('flask_responses_total', 'Responses sent, per endpoint and status code.')
+
+REGISTRY = [REQUEST_DURATION, DB_DURATION, DB_QUERIES, RESPONSES]
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ============ REQUEST HOOKS ============
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_time = 0.0
+
+
+def _after_request(response):
+    start = g.get('metrics_start')
+    if start is None:
+        return response
+
+    total = time.perf_counter() - start
+    db_time = g.db_time
+    endpoint = request.endpoint or 'unmatched'
+    labels = {'endpoint': endpoint, 'method': request.method}
+    REQUEST_DURATION.observe(labels, total)
+    DB_DURATION.observe(labels, db_time)
+    DB_QUERIES.inc(labels, g.db_queries)
+    RESPONSES.inc({'endpoint': endpoint, 'status': str(response.status_code)})
+
+    response.headers['Server-Timing'] = ', '.join([
+        f'db;dur={db_time * 1000:.1f};desc="{g.db_queries} queries"',
+        f'app;dur={max(total - db_time, 0.0) * 1000:.1f}',
+        f'total;dur={total * 1000:.1f}',
+    ])
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['query_start'].pop()
+    if g and 'metrics_start' in g:
+        g.db_queries += 1
+        g.db_time += time.perf_counter() - start
+
+
+def _handle_error(exception_context):
+    starts = exception_context.connection.info.get('query_start') if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+
+def _metrics():
+    """GET /metrics"""
+    if request.remote_addr not in current_app.config['METRICS_ALLOWED_IPS']:
+        abort(404)
+    return Response(render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', _metrics)
+
+    # Listening on the Engine class covers every engine the app creates
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
@@ -1,16 +1,28 @@
-from app import db
+from app import db, textstore
+from app.images import srcset, thumbnail_url
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session, object_session
 from datetime import datetime
 
 class Story(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
-    status = db.Column(db.String(20), default='published')  # draft/published/suspended
-    start_page_id = db.Column(db.Integer, db.ForeignKey('page.id'))
+    status = db.Column(db.String(20), default='draft')  # draft/published/suspended; published only once valid
+    start_page_id = db.Column(db.Integer, db.ForeignKey('page.id', ondelete='SET NULL'))
     illustration = db.Column(db.String(500))  # Level 18
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    pages = db.relationship('Page', backref='story', lazy=True, foreign_keys='Page.story_id')
+    # Pages and their choices are removed by ON DELETE CASCADE, without loading them
+    pages = db.relationship(
+        'Page',
+        backref='story',
+        lazy=True,
+        cascade='all, delete-orphan',
+        passive_deletes=True,
+        foreign_keys='Page.story_id'
+    )
     
     def to_dict(self):
         return {
@@ -20,13 +32,15 @@ class Story(db.Model):
             'status': self.status,
             'start_page_id': self.start_page_id,
             'illustration': self.illustration,
+            'illustration_url': thumbnail_url(self.illustration),
+            'illustration_srcset': srcset(self.illustration),
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
 class Page(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    story_id = db.Column(db.Integer, db.ForeignKey('story.id'), nullable=False)
-    text = db.Column(db.Text, nullable=False)
+    story_id = db.Column(db.Integer, db.ForeignKey('story.id', ondelete='CASCADE'), nullable=False, index=True)
+    text_hash = db.Column(db.String(64), nullable=False)  # text lives in TextBlob
     is_ending = db.Column(db.Boolean, default=False)
     ending_label = db.Column(db.String(100))  
     illustration = db.Column(db.String(500))  
@@ -36,9 +50,27 @@ class Page(db.Model):
         backref='page', 
         lazy=True, 
         cascade='all, delete-orphan',
+        passive_deletes=True,
         foreign_keys='Choice.page_id' 
     )
 
+    _pending_text = None
+
+    @property
+    def text(self):
+        if self._pending_text is not None:
+            return self._pending_text
+        return textstore.load(object_session(self) or db.session, self.text_hash)
+
+    @text.setter
+    def text(self, value):
+        if value is None:
+            self.text_hash = None
+            self._pending_text = None
+        else:
+            self.text_hash = textstore.text_hash(value)
+            self._pending_text = value
+
     def to_dict(self, include_choices=True):
         data = {
             'id': self.id,
@@ -46,7 +78,9 @@ class Page(db.Model):
             'text': self.text,
             'is_ending': self.is_ending,
             'ending_label': self.ending_label,
-            'illustration': self.illustration
+            'illustration': self.illustration,
+            'illustration_url': thumbnail_url(self.illustration),
+            'illustration_srcset': srcset(self.illustration)
         }
         if include_choices:
             data['choices'] = [choice.to_dict() for choice in self.choices]
@@ -54,9 +88,9 @@ class Page(db.Model):
 
 class Choice(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    page_id = db.Column(db.Integer, db.ForeignKey('page.id'), nullable=False)
+    page_id = db.Column(db.Integer, db.ForeignKey('page.id', ondelete='CASCADE'), nullable=False, index=True)
     text = db.Column(db.String(200), nullable=False)
-    next_page_id = db.Column(db.Integer, db.ForeignKey('page.id'), nullable=False)
+    next_page_id = db.Column(db.Integer, db.ForeignKey('page.id', ondelete='CASCADE'), nullable=False, index=True)
     
     def to_dict(self):
         return {
@@ -64,4 +98,64 @@ class Choice(db.Model):
             'page_id': self.page_id,
             'text': self.text,
             'next_page_id': self.next_page_id
-        }
\ No newline at end of file
+        }
+
+class TextBlob(db.Model):
+    __tablename__ = 'text_blob'
+
+    hash = db.Column(db.String(64), primary_key=True)  # SHA-256 of the UTF-8 text
+    data = db.Column(db.LargeBinary, nullable=False)
+    compressed = db.Column(db.Boolean, nullable=False, default=False)  # zlib
+
+class CatalogVersion(db.Model):
+    """Single-row write counter in each database file, polled by Django to invalidate its cache.
+
+    Every transaction that writes is bumped on commit (see _bump_on_commit), so
+    the counter lives in the same file and the same transaction as the change.
+    """
+    __tablename__ = 'catalog_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def bump(cls, connection):
+        table = cls.__table__
+        connection.execute(
+            insert(table).values(id=1, version=1)
+            .on_conflict_do_update(index_elements=['id'], set_={'version': table.c.version + 1})
+        )
+
+    @classmethod
+    def current(cls, session):
+        # A query rather than session.get: bumps bypass the identity map
+        return session.execute(db.select(cls.version).where(cls.id == 1)).scalar() or 0
+
+
+# Listening on the Session class covers db.session and every shard session.
+# Bulk statements don't go through the unit of work, so they are noted separately.
+
+_WROTE = 'catalog_wrote'
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _note_statement_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info[_WROTE] = True
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_flush(session, flush_context):
+    session.info[_WROTE] = True
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_on_commit(session):
+    if session.info.pop(_WROTE, False) or session.new or session.deleted or session.dirty:
+        # Through the connection, so the bump is not itself noted as a write
+        CatalogVersion.bump(session.connection())
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_writes(session):
+    session.info.pop(_WROTE, None)
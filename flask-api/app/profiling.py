@@ -0,0 +1,155 @@
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, request
+
+# On-demand profiling of single requests: a cProfile-only copy of
+# django-app/stories/profiling.py, which documents the capture format. The two
+# services ship as separate images, so they cannot share the module; keep the
+# file names and the `.collapsed` format in step with it.
+
+SAMPLE_INTERVAL = 0.001
+CAPTURE_EXTENSIONS = {'prof', 'txt', 'collapsed'}
+
+# Python 3.12+ allows one cProfile per process; concurrent requests skip profiling
+capture_lock = threading.Lock()
+
+
+def should_profile(supplied_token, token, sample_rate):
+    if token and supplied_token and hmac.compare_digest(supplied_token, token):
+        return True
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+class StackSampler(threading.Thread):
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class Profile:
+    def __init__(self):
+        self.sampler = StackSampler(threading.get_ident())
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.sampler.start()
+        self.profiler.enable()
+        return self
+
+    def stop(self):
+        self.profiler.disable()
+        self.sampler.stop()
+        self.duration = time.perf_counter() - self.started
+
+    def save(self, directory, label, keep):
+        os.makedirs(directory, exist_ok=True)
+        label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label).strip('_') or 'request'
+        now = time.time()
+        # Millisecond timestamps keep names unique and sorting oldest first
+        name = f'{time.strftime("%Y%m%d-%H%M%S", time.localtime(now))}.{int(now * 1000) % 1000:03d}-{label}-{self.duration * 1000:.0f}ms-{os.getpid()}-{threading.get_ident()}'
+        base = os.path.join(directory, name)
+
+        self.profiler.dump_stats(f'{base}.prof')
+        with open(f'{base}.txt', 'w') as f:
+            pstats.Stats(self.profiler, stream=f).sort_stats('cumulative').print_stats(40)
+        with open(f'{base}.collapsed', 'w') as f:
+            f.write(''.join(f'{stack} {count}\n' for stack, count in self.sampler.stacks.most_common()))
+        prune(directory, keep)
+        return name
+
+
+def prune(directory, keep):
+    if not keep:
+        return
+    captures = {}
+    for entry in os.scandir(directory):
+        prefix, _, extension = entry.name.rpartition('.')
+        if extension in CAPTURE_EXTENSIONS and entry.is_file():
+            captures.setdefault(prefix, []).append(entry.path)
+    for prefix in sorted(captures)[:-keep]:
+        for path in captures[prefix]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# ============ REQUEST HOOKS ============
+
+def _before_request():
+    config = current_app.config
+    token = config['PROFILE_TOKEN']
+    supplied = None
+    if token:
+        supplied = request.headers.get('X-Profile')
+        if supplied is None and b'profile=' in request.query_string:
+            supplied = request.args.get('profile')
+    if not should_profile(supplied, token, config['PROFILE_SAMPLE_RATE']):
+        return
+    if not capture_lock.acquire(blocking=False):
+        return
+    g.profile = Profile().start()
+
+
+def _finish(label):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return None
+    try:
+        profile.stop()
+        return profile.save(current_app.config['PROFILE_DIR'], label, current_app.config['PROFILE_MAX_CAPTURES'])
+    finally:
+        capture_lock.release()
+
+
+def _after_request(response):
+    if 'profile' not in g:
+        return response
+    name = _finish(request.endpoint or 'unmatched')
+    if name:
+        response.headers['X-Profile-Id'] = name
+    return response
+
+
+def _teardown_request(exc):
+    # Requests that raised never reach after_request
+    if 'profile' in g:
+        _finish(f'{request.endpoint or "unmatched"}-error')
+
+
+def init_app(app):
+    # No hooks at all unless a profile directory is configured
+    if not app.config['PROFILE_DIR']:
+        return
+    # Registered first so the profile covers the other request hooks too
+    app.before_request_funcs.setdefault(None, []).insert(0, _before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
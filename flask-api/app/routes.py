@@ -1,45 +1,143 @@
-from flask import Blueprint, request, jsonify
-from app import db
-from app.models import Story, Page, Choice
+from flask import Blueprint, request, jsonify, make_response, send_file, abort
+from sqlalchemy.exc import IntegrityError
+from app.models import Story, Page, Choice, CatalogVersion
+from app import db, graph, images, shards, singleflight, validation
 
 bp = Blueprint('api', __name__)
 
 API_KEY = "your-secret-api-key-12345"
 
+# Columns named in constraint errors, as the API calls them
+API_FIELDS = {'text_hash': 'text'}
+
+@bp.errorhandler(IntegrityError)
+def integrity_error(e):
+    """Constraint failures are bad input: a link to a missing row, or a missing or duplicate value"""
+    message = str(e.orig)
+    column = message.rpartition(': ')[2].split(', ')[0].rpartition('.')[2]
+    field = API_FIELDS.get(column, column)
+    if message.startswith('FOREIGN KEY'):
+        error = 'Referenced story or page does not exist'
+    elif message.startswith('NOT NULL'):
+        error = f'{field} is required'
+    elif message.startswith('UNIQUE'):
+        error = f'{field} is already in use'
+    else:
+        error = 'Request conflicts with existing data'
+    return jsonify({'error': error}), 400
+
+def unpublish_if_broken(session, story_id):
+    """Move a published story the pending write has broken back to draft; returns the report if so"""
+    story = session.get(Story, story_id)
+    if story is None or story.status != 'published':
+        return None
+    session.flush()
+    report = validation.check(session, story)
+    if report['valid']:
+        return None
+    story.status = 'draft'
+    return report
+
+def with_story_status(response, report):
+    """Tell the caller when its write sent the story back to draft"""
+    if report is not None:
+        response.headers['X-Story-Status'] = 'draft'
+    return response
+
 # ============ READING ENDPOINTS (PUBLIC) ============
 
+@bp.route('/version', methods=['GET'])
+def get_version():
+    """GET /version - changes whenever any story, page or choice changes"""
+    # Sum of every shard's counter; with shards, the unsharded file's counter no
+    # longer moves but stays in the sum so the version never goes backwards
+    sessions = shards.all_sessions()
+    if shards.shard_count() > 1:
+        sessions.append(db.session)
+    return jsonify({'version': sum(CatalogVersion.current(session) for session in sessions)})
+
 @bp.route('/stories', methods=['GET'])
 def get_stories():
     """GET /stories?status=published"""
     status = request.args.get('status')
     
     if status:
-        stories = Story.query.filter_by(status=status).all()
+        stories = shards.query_all(Story, Story.status == status)
     else:
-        stories = Story.query.all()
+        stories = shards.query_all(Story)
     
     return jsonify([s.to_dict() for s in stories])
 
 @bp.route('/stories/<int:story_id>', methods=['GET'])
 def get_story(story_id):
     """GET /stories/<id>"""
-    story = Story.query.get_or_404(story_id)
+    story = shards.get_or_404(shards.session_for(story_id), Story, story_id)
     return jsonify(story.to_dict())
 
+def _load_story_start(story_id):
+    session = shards.session_for(story_id)
+    story = session.get(Story, story_id)
+    if story is None:
+        return None, 404
+    if not story.start_page_id:
+        return {'error': 'Story has no start page'}, 400
+    start_page = session.get(Page, story.start_page_id)
+    if start_page is None or start_page.story_id != story_id:
+        return {'error': 'Story start page not found'}, 404
+    return start_page.to_dict(), 200
+
+def _load_page(page_id):
+    page = shards.session_for(page_id).get(Page, page_id)
+    if page is None:
+        return None, 404
+    return page.to_dict(), 200
+
 @bp.route('/stories/<int:story_id>/start', methods=['GET'])
 def get_story_start(story_id):
     """GET /stories/<id>/start"""
-    story = Story.query.get_or_404(story_id)
-    if not story.start_page_id:
-        return jsonify({'error': 'Story has no start page'}), 400
-    start_page = Page.query.get(story.start_page_id)
-    return jsonify(start_page.to_dict())
+    # Simultaneous players of the same story share one query
+    data, status = singleflight.reads.do(('start', story_id), lambda: _load_story_start(story_id))
+    if data is None:
+        abort(status)
+    return jsonify(data), status
+
+@bp.route('/stories/<int:story_id>/validation', methods=['GET'])
+def get_story_validation(story_id):
+    """GET /stories/<id>/validation - broken links, dead ends and unreachable pages"""
+    session = shards.session_for(story_id)
+    story = shards.get_or_404(session, Story, story_id)
+    return jsonify(validation.report(session, story))
 
 @bp.route('/pages/<int:page_id>', methods=['GET'])
 def get_page(page_id):
     """GET /pages/<id>"""
-    page = Page.query.get_or_404(page_id)
-    return jsonify(page.to_dict())
+    data, status = singleflight.reads.do(('page', page_id), lambda: _load_page(page_id))
+    if data is None:
+        abort(status)
+    return jsonify(data), status
+
+@bp.route('/thumbnails/<int:width>', methods=['GET'])
+def get_thumbnail(width):
+    """GET /thumbnails/<width>?src=<illustration>&sig=<signature>[&v=<digest>]"""
+    src = request.args.get('src')
+    if not src or width not in images.THUMBNAIL_WIDTHS:
+        abort(404)
+    if not images.check_signature(src, request.args.get('sig')):
+        abort(403)
+    try:
+        path, etag = images.thumbnail(src, width)
+    except images.ImageError as e:
+        images.logger.warning('Thumbnail of %s failed: %s', src, e)
+        return jsonify({'error': 'Illustration not available'}), 404
+
+    # Only a URL naming the current digest can be cached for good; without it
+    # the browser revalidates so a replaced illustration shows up
+    if request.args.get('v') == etag.rsplit('-', 1)[0]:
+        response = send_file(path, mimetype='image/webp', etag=etag, max_age=31536000, conditional=True)
+        response.cache_control.immutable = True
+    else:
+        response = send_file(path, mimetype='image/webp', etag=etag, max_age=images.SOURCE_REVALIDATE_SECONDS, conditional=True)
+    return response
 
 # ============ WRITING ENDPOINTS ============
 
@@ -47,51 +145,97 @@ def get_page(page_id):
 def create_story():
     """POST /stories"""
     data = request.json
+    if data.get('status') == 'published':
+        # An empty story can never pass validation; publish it once it has pages
+        return jsonify({'error': 'New stories start as drafts; publish them once they are complete'}), 400
     story = Story(
         title=data.get('title'),
         description=data.get('description'),
-        status=data.get('status', 'published')
+        status=data.get('status', 'draft')
     )
-    db.session.add(story)
-    db.session.commit()
+    session, shard = shards.session_for_new_story()
+    shards.insert(session, story, shard)
     return jsonify(story.to_dict()), 201
 
 @bp.route('/stories/<int:story_id>', methods=['PUT'])
 def update_story(story_id):
     """PUT /stories/<id>"""
-    story = Story.query.get_or_404(story_id)
+    session = shards.session_for(story_id)
+    story = shards.get_or_404(session, Story, story_id)
     data = request.json
     
     if 'title' in data:
         story.title = data['title']
     if 'description' in data:
         story.description = data['description']
-    if 'status' in data:
-        story.status = data['status']
     if 'start_page_id' in data:
+        start_page = session.get(Page, data['start_page_id']) if data['start_page_id'] else None
+        if data['start_page_id'] and (start_page is None or start_page.story_id != story_id):
+            return jsonify({'error': 'Start page must belong to this story'}), 400
         story.start_page_id = data['start_page_id']
+    publishing = data.get('status') == 'published' and story.status != 'published'
+    if publishing:
+        if 'start_page_id' in data:
+            # Check the graph as it will be saved
+            session.flush()
+            report = validation.check(session, story)
+        else:
+            report = validation.report(session, story)
+        if not report['valid']:
+            session.rollback()
+            return jsonify({'error': 'Story cannot be published', 'validation': report}), 400
+    if 'status' in data:
+        story.status = data['status']
+    report = None
+    if 'start_page_id' in data and not publishing:
+        report = unpublish_if_broken(session, story_id)
     if 'illustration' in data:
         story.illustration = data['illustration']
     
-    db.session.commit()
-    return jsonify(story.to_dict())
+    session.commit()
+    return with_story_status(jsonify(story.to_dict()), report)
 
 @bp.route('/stories/<int:story_id>', methods=['DELETE'])
 def delete_story(story_id):
     """DELETE /stories/<id>"""
-    story = Story.query.get_or_404(story_id)
-    
-    Page.query.filter_by(story_id=story_id).delete()
+    session = shards.session_for(story_id)
     
-    db.session.delete(story)
-    db.session.commit()
+    # Pages and choices go with it through ON DELETE CASCADE
+    if not session.query(Story).filter_by(id=story_id).delete():
+        abort(404)
+    session.commit()
     
     return '', 204
 
+@bp.route('/stories/<int:story_id>/graph', methods=['PATCH'])
+def patch_story_graph(story_id):
+    """PATCH /stories/<id>/graph - batch of page/choice operations, all or nothing"""
+    session = shards.session_for(story_id)
+    story = shards.get_or_404(session, Story, story_id)
+    data = request.json or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Body must be a JSON object with an operations list'}), 400
+    
+    try:
+        refs = graph.apply(session, story, data.get('operations', []), data.get('start_page_id'))
+    except graph.GraphError as e:
+        session.rollback()
+        return jsonify({'error': str(e)}), 400
+    if story.status == 'published':
+        # The batch is all or nothing, so a published story only takes batches that keep it valid
+        report = validation.check(session, story)
+        if not report['valid']:
+            session.rollback()
+            return jsonify({'error': 'Changes would break this published story', 'validation': report}), 400
+    session.commit()
+    
+    return jsonify({'story': story.to_dict(), 'created': refs})
+
 @bp.route('/stories/<int:story_id>/pages', methods=['POST'])
 def create_page(story_id):
     """POST /stories/<id>/pages"""
-    story = Story.query.get_or_404(story_id)
+    session = shards.session_for(story_id)
+    story = shards.get_or_404(session, Story, story_id)
     data = request.json
     
     page = Page(
@@ -101,34 +245,43 @@ def create_page(story_id):
         ending_label=data.get('ending_label'),
         illustration=data.get('illustration')
     )
-    db.session.add(page)
-    db.session.commit()
+    shards.lock_for_write(session)
+    shards.add(session, page, shards.shard_for(story_id))
     
     if not story.start_page_id:
         story.start_page_id = page.id
-        db.session.commit()
+    report = unpublish_if_broken(session, story_id)
+    session.commit()
     
-    return jsonify(page.to_dict()), 201
+    return with_story_status(jsonify(page.to_dict()), report), 201
 
 @bp.route('/pages/<int:page_id>/choices', methods=['POST'])
 def create_choice(page_id):
     """POST /pages/<id>/choices"""
-    page = Page.query.get_or_404(page_id)
+    session = shards.session_for(page_id)
+    page = shards.get_or_404(session, Page, page_id)
     data = request.json
     
+    next_page = session.get(Page, data.get('next_page_id')) if data.get('next_page_id') else None
+    if next_page is None or next_page.story_id != page.story_id:
+        return jsonify({'error': 'next_page_id must be a page of the same story'}), 400
+    
     choice = Choice(
         page_id=page_id,
         text=data.get('text'),
-        next_page_id=data.get('next_page_id')
+        next_page_id=next_page.id
     )
-    db.session.add(choice)
-    db.session.commit()
-    return jsonify(choice.to_dict()), 201
+    shards.lock_for_write(session)
+    shards.add(session, choice, shards.shard_for(page_id))
+    report = unpublish_if_broken(session, page.story_id)
+    session.commit()
+    return with_story_status(jsonify(choice.to_dict()), report), 201
 
 @bp.route('/pages/<int:page_id>', methods=['PUT'])
 def update_page(page_id):
     """PUT /pages/<id>"""
-    page = Page.query.get_or_404(page_id)
+    session = shards.session_for(page_id)
+    page = shards.get_or_404(session, Page, page_id)
     data = request.json
     
     if 'text' in data:
@@ -140,21 +293,31 @@ def update_page(page_id):
     if 'illustration' in data:
         page.illustration = data['illustration']
     
-    db.session.commit()
-    return jsonify(page.to_dict())
+    report = unpublish_if_broken(session, page.story_id)
+    session.commit()
+    return with_story_status(jsonify(page.to_dict()), report)
 
 @bp.route('/pages/<int:page_id>', methods=['DELETE'])
 def delete_page(page_id):
     """DELETE /pages/<id>"""
-    page = Page.query.get_or_404(page_id)
-    db.session.delete(page)
-    db.session.commit()
-    return '', 204
+    session = shards.session_for(page_id)
+    story_id = session.query(Page.story_id).filter_by(id=page_id).scalar()
+    if story_id is None or not session.query(Page).filter_by(id=page_id).delete():
+        abort(404)
+    report = unpublish_if_broken(session, story_id)
+    session.commit()
+    return with_story_status(make_response('', 204), report)
 
 @bp.route('/choices/<int:choice_id>', methods=['DELETE'])
 def delete_choice(choice_id):
     """DELETE /choices/<id>"""
-    choice = Choice.query.get_or_404(choice_id)
-    db.session.delete(choice)
-    db.session.commit()
-    return '', 204
\ No newline at end of file
+    session = shards.session_for(choice_id)
+    story_id = (
+        session.query(Page.story_id).join(Choice, Choice.page_id == Page.id)
+        .filter(Choice.id == choice_id).scalar()
+    )
+    if story_id is None or not session.query(Choice).filter_by(id=choice_id).delete():
+        abort(404)
+    report = unpublish_if_broken(session, story_id)
+    session.commit()
+    return with_story_status(make_response('', 204), report)
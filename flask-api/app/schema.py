@@ -0,0 +1,88 @@
+import sqlite3
+
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateTable
+
+from app import db
+
+# Deleting a story or page cascades in SQLite itself: page and choice foreign
+# keys are declared ON DELETE CASCADE (story.start_page_id ON DELETE SET NULL)
+# and every connection runs with PRAGMA foreign_keys=ON. Databases created
+# before that are rebuilt once by upgrade_schema.
+
+# Tables in the order they are rebuilt; parents first
+TABLES = ('story', 'page', 'choice')
+
+
+@event.listens_for(Engine, 'connect')
+def _enable_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+def _on_delete_rules(table):
+    return {(fk.parent.name, fk.ondelete.upper()) for fk in table.foreign_keys if fk.ondelete}
+
+
+def _needs_rebuild(inspector, table):
+    existing = {
+        (column, (fk.get('options') or {}).get('ondelete', '').upper())
+        for fk in inspector.get_foreign_keys(table.name)
+        for column in fk['constrained_columns']
+    }
+    return not _on_delete_rules(table) <= existing
+
+
+def _rebuild(connection, table):
+    """Recreate `table` from the model definition, keeping its rows (SQLite's ALTER TABLE recipe)"""
+    new_name = f'{table.name}_new'
+    ddl = str(CreateTable(table).compile(connection)).strip()
+    ddl = ddl.replace(f'CREATE TABLE {table.name} ', f'CREATE TABLE {new_name} ', 1)
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    columns = ', '.join(column.name for column in table.columns if column.name in existing)
+
+    connection.exec_driver_sql(ddl)
+    connection.exec_driver_sql(f'INSERT INTO {new_name} ({columns}) SELECT {columns} FROM {table.name}')
+    connection.exec_driver_sql(f'DROP TABLE {table.name}')
+    connection.exec_driver_sql(f'ALTER TABLE {new_name} RENAME TO {table.name}')
+
+
+def upgrade_schema(engine):
+    """Add ON DELETE rules and foreign key indexes to tables created before them"""
+    tables = [db.metadata.tables[name] for name in TABLES]
+    inspector = inspect(engine)
+    stale = [table for table in tables if _needs_rebuild(inspector, table)]
+
+    if stale:
+        with engine.connect() as connection:
+            # Must be switched off outside a transaction, or DROP TABLE would cascade
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+            # pysqlite does not open a transaction for DDL by itself
+            connection.exec_driver_sql('BEGIN')
+            try:
+                for table in stale:
+                    _rebuild(connection, table)
+                # Rows orphaned by bulk deletes made before cascades existed
+                connection.exec_driver_sql(
+                    'DELETE FROM page WHERE story_id NOT IN (SELECT id FROM story)')
+                connection.exec_driver_sql(
+                    'DELETE FROM choice WHERE page_id NOT IN (SELECT id FROM page) '
+                    'OR next_page_id NOT IN (SELECT id FROM page)')
+                connection.exec_driver_sql(
+                    'UPDATE story SET start_page_id = NULL '
+                    'WHERE start_page_id NOT IN (SELECT id FROM page)')
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                connection.exec_driver_sql('PRAGMA foreign_keys=ON')
+                connection.commit()
+
+    with engine.begin() as connection:
+        for table in tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
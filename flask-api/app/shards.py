@@ -0,0 +1,133 @@
+import heapq
+import itertools
+import os
+
+from flask import abort, current_app, g
+from sqlalchemy import create_engine, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db, schema, textstore
+
+# Stories are partitioned by story_id % STORY_SHARDS. Every row of a story
+# (its pages and choices too) lives in the story's shard and gets an id with
+# the same residue, so any story, page or choice id routes to its shard
+# without a lookup. With STORY_SHARDS = 1 the regular db.session is used.
+
+INSERT_RETRIES = 5
+
+
+def init_app(app):
+    count = app.config['STORY_SHARDS']
+    engines = []
+    if count > 1:
+        os.makedirs(app.instance_path, exist_ok=True)
+        for shard in range(count):
+            path = os.path.join(app.instance_path, f'stories-{shard}.db')
+            engine = create_engine(f'sqlite:///{path}')
+            db.metadata.create_all(engine)
+            textstore.upgrade_schema(engine, app.config['TEXT_COMPRESS_THRESHOLD'])
+            schema.upgrade_schema(engine)
+            engines.append(engine)
+    app.extensions['story_shards'] = {'engines': engines, 'next': itertools.count()}
+    app.teardown_appcontext(_close_sessions)
+
+
+def shard_count():
+    return current_app.config['STORY_SHARDS']
+
+
+def shard_for(id):
+    return id % shard_count()
+
+
+def session_for_shard(shard):
+    if shard_count() == 1:
+        return db.session
+    sessions = g.setdefault('shard_sessions', {})
+    if shard not in sessions:
+        engine = current_app.extensions['story_shards']['engines'][shard]
+        sessions[shard] = Session(engine, expire_on_commit=False)
+    return sessions[shard]
+
+
+def session_for(id):
+    """Session of the shard holding the story, page or choice with this id"""
+    return session_for_shard(shard_for(id))
+
+
+def session_for_new_story():
+    """(session, shard) to create a new story in, round-robin across shards"""
+    shard = next(current_app.extensions['story_shards']['next']) % shard_count()
+    return session_for_shard(shard), shard
+
+
+def all_sessions():
+    return [session_for_shard(shard) for shard in range(shard_count())]
+
+
+def get_or_404(session, model, id):
+    obj = session.get(model, id)
+    if obj is None:
+        abort(404)
+    return obj
+
+
+def insert(session, obj, shard):
+    """Add and commit `obj`, giving it an id that routes back to `shard`"""
+    count = shard_count()
+    if count == 1:
+        session.add(obj)
+        session.commit()
+        return obj
+
+    model = type(obj)
+    for attempt in range(INSERT_RETRIES):
+        max_id = session.query(func.max(model.id)).scalar() or 0
+        obj.id = max_id + ((shard - max_id) % count or count)
+        session.add(obj)
+        try:
+            session.commit()
+            return obj
+        except IntegrityError:
+            # Another writer took the same id; pick the next free one
+            session.rollback()
+            if attempt == INSERT_RETRIES - 1:
+                raise
+
+
+def lock_for_write(session):
+    """Take SQLite's write lock now, so ids read by `add` stay free until commit"""
+    dbapi_connection = session.connection().connection.driver_connection
+    if not dbapi_connection.in_transaction:
+        dbapi_connection.execute('BEGIN IMMEDIATE')
+
+
+def add(session, obj, shard):
+    """Add and flush `obj` inside the caller's transaction, with an id that routes back to `shard`"""
+    count = shard_count()
+    if count > 1:
+        model = type(obj)
+        max_id = session.query(func.max(model.id)).scalar() or 0
+        obj.id = max_id + ((shard - max_id) % count or count)
+    session.add(obj)
+    session.flush()
+    return obj
+
+
+def query_all(model, *criteria, order_by=None):
+    """Rows matching `criteria` from every shard, merged in `order_by` order (default id)"""
+    order_by = order_by if order_by is not None else model.id
+    per_shard = [
+        session.query(model).filter(*criteria).order_by(order_by).all()
+        for session in all_sessions()
+    ]
+    if len(per_shard) == 1:
+        return per_shard[0]
+    key = order_by.key
+    return list(heapq.merge(*per_shard, key=lambda row: getattr(row, key)))
+
+
+def _close_sessions(exc):
+    for session in g.pop('shard_sessions', {}).values():
+        session.close()
@@ -0,0 +1,53 @@
+import threading
+
+from app import metrics
+
+# Concurrent requests for the same hot read (a story's start page, a page) share
+# one database query: the first request runs it, the others wait for its
+# result. Nothing is kept once the call finishes, so results are never older
+# than a query that was already in flight when the request arrived.
+
+COALESCED = metrics.Counter('flask_coalesced_requests_total', 'Reads answered by another request\'s in-flight query.')
+metrics.REGISTRY.append(COALESCED)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Group:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Return fn(), or the result of an identical call already running for `key`"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            COALESCED.inc({'key': key[0]})
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+reads = Group()
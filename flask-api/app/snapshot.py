@@ -0,0 +1,287 @@
+import io
+import mmap
+import os
+import stat
+import struct
+import time
+from datetime import datetime
+
+import click
+import msgpack
+from sqlalchemy import DateTime, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert
+
+from app import shards
+from app.models import Choice, Page, Story, TextBlob
+
+# Catalog snapshots: a stream of length-prefixed msgpack records. A record is
+# a little-endian uint32 byte count followed by that many bytes of msgpack, so
+# a reader can skip records without decoding them. The first record is a
+# header naming the columns; every following record holds one whole story
+# (its row, page texts, pages and choices as column-ordered arrays), so both
+# export and import only ever hold one story in memory. Files are read through
+# mmap, so records are decoded straight out of the page cache.
+
+MAGIC = 'nahb-stories'
+VERSION = 1
+TABLES = {'story': Story.__table__, 'page': Page.__table__, 'choice': Choice.__table__}
+INSERT_BATCH = 5000
+
+_length = struct.Struct('<I')
+
+
+def _columns(table):
+    return [column.name for column in table.columns]
+
+
+def write_record(stream, obj):
+    data = msgpack.packb(obj, use_bin_type=True)
+    stream.write(_length.pack(len(data)))
+    stream.write(data)
+
+
+def read_records(stream):
+    """Decode the records of `stream`, memory-mapping it when it is a regular file"""
+    try:
+        fileno = stream.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fileno = None
+    info = os.fstat(fileno) if fileno is not None else None
+    if info is None or not stat.S_ISREG(info.st_mode):
+        yield from _read_stream(stream)
+        return
+    size = info.st_size
+    if not size:
+        return  # mmap refuses empty files
+    with mmap.mmap(fileno, size, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            yield from _read_buffer(view)
+        finally:
+            view.release()
+
+
+def _read_buffer(view):
+    offset = 0
+    while offset < len(view):
+        if len(view) - offset < _length.size:
+            raise ValueError('Truncated snapshot')
+        (size,) = _length.unpack_from(view, offset)
+        offset += _length.size
+        if len(view) - offset < size:
+            raise ValueError('Truncated snapshot')
+        with view[offset:offset + size] as data:
+            record = msgpack.unpackb(data, raw=False)
+        offset += size
+        yield record
+
+
+def _read_stream(stream):
+    while True:
+        prefix = stream.read(_length.size)
+        if not prefix:
+            return
+        if len(prefix) < _length.size:
+            raise ValueError('Truncated snapshot')
+        (size,) = _length.unpack(prefix)
+        data = stream.read(size)
+        if len(data) < size:
+            raise ValueError('Truncated snapshot')
+        yield msgpack.unpackb(data, raw=False)
+
+
+def _dump_row(row):
+    return [
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in row
+    ]
+
+
+def _load_row(table, values):
+    row = dict(zip(_columns(table), values))
+    for column in table.columns:
+        if isinstance(column.type, DateTime) and row.get(column.name):
+            row[column.name] = datetime.fromisoformat(row[column.name])
+    return row
+
+
+# ============ EXPORT ============
+
+def export_stories(stream):
+    """Write every story of every shard to `stream`; returns (stories, pages) written"""
+    write_record(stream, {
+        'format': MAGIC,
+        'version': VERSION,
+        'columns': {name: _columns(table) for name, table in TABLES.items()},
+    })
+    story_count = page_count = 0
+    for session in shards.all_sessions():
+        story_ids = session.execute(select(Story.id).order_by(Story.id)).scalars().all()
+        for story_id in story_ids:
+            story = session.execute(select(Story.__table__).where(Story.id == story_id)).one()
+            pages = session.execute(
+                select(Page.__table__).where(Page.story_id == story_id).order_by(Page.id)
+            ).all()
+            choices = session.execute(
+                select(Choice.__table__)
+                .join(Page, Page.id == Choice.page_id)
+                .where(Page.story_id == story_id)
+                .order_by(Choice.id)
+            ).all()
+            texts = session.execute(
+                select(TextBlob.hash, TextBlob.data, TextBlob.compressed)
+                .where(TextBlob.hash.in_({page.text_hash for page in pages}))
+            ).all()
+            write_record(stream, [
+                _dump_row(story),
+                [list(text) for text in texts],
+                [_dump_row(page) for page in pages],
+                [_dump_row(choice) for choice in choices],
+            ])
+            story_count += 1
+            page_count += len(pages)
+    return story_count, page_count
+
+
+# ============ IMPORT ============
+
+class _Shard:
+    """Rows waiting to be inserted into one shard, and its id allocator"""
+
+    def __init__(self, shard, keep_ids):
+        self.shard = shard
+        self.session = shards.session_for_shard(shard)
+        shards.lock_for_write(self.session)
+        # Stories are inserted before their start pages exist; check keys at commit
+        self.session.connection().exec_driver_sql('PRAGMA defer_foreign_keys=ON')
+        self.keep_ids = keep_ids
+        self.pending = {'text': [], 'story': [], 'page': [], 'choice': []}
+        self.last_id = {}
+        if not keep_ids:
+            for name, table in TABLES.items():
+                self.last_id[name] = self.session.execute(select(func.max(table.c.id))).scalar() or 0
+
+    def new_id(self, name, old_id):
+        count = shards.shard_count()
+        if self.keep_ids:
+            if old_id % count != self.shard:
+                raise ValueError(f'{name} id {old_id} does not fit STORY_SHARDS={count}; import without --keep-ids')
+            return old_id
+        last = self.last_id[name]
+        self.last_id[name] = last + ((self.shard - last) % count or count)
+        return self.last_id[name]
+
+    def flush(self, force=False):
+        for name in ('text', 'story', 'page', 'choice'):
+            rows = self.pending[name]
+            if not rows or (not force and len(rows) < INSERT_BATCH):
+                continue
+            if name == 'text':
+                statement = insert(TextBlob.__table__).on_conflict_do_nothing(index_elements=['hash'])
+            else:
+                statement = insert(TABLES[name])
+            self.session.execute(statement, rows)
+            self.pending[name] = []
+
+
+def import_stories(stream, keep_ids=False):
+    """Load a snapshot in one transaction per shard; returns (stories, pages, skipped choices).
+
+    Ids are renumbered to follow the existing catalog unless `keep_ids` is set.
+    Choices leading to a page of another story are skipped and counted.
+    """
+    records = read_records(stream)
+    try:
+        header = next(records, None)
+    except (ValueError, msgpack.UnpackException):
+        header = None
+    if not isinstance(header, dict) or header.get('format') != MAGIC:
+        raise ValueError('Not a story snapshot')
+    if header.get('version') != VERSION:
+        raise ValueError(f'Unsupported snapshot version {header.get("version")}')
+    for name, table in TABLES.items():
+        if header['columns'][name] != _columns(table):
+            raise ValueError(f'Snapshot {name} columns do not match this database')
+
+    count = shards.shard_count()
+    targets = {}
+    story_count = page_count = skipped_count = 0
+    try:
+        for story_values, texts, page_values, choice_values in records:
+            story = _load_row(Story.__table__, story_values)
+            shard = story['id'] % count if keep_ids else story_count % count
+            target = targets.get(shard)
+            if target is None:
+                target = targets[shard] = _Shard(shard, keep_ids)
+
+            story['id'] = story_id = target.new_id('story', story['id'])
+            page_ids = {}
+            for values in page_values:
+                page = _load_row(Page.__table__, values)
+                page_ids[page['id']] = page['id'] = target.new_id('page', page['id'])
+                page['story_id'] = story_id
+                target.pending['page'].append(page)
+
+            story['start_page_id'] = page_ids.get(story['start_page_id'])
+            target.pending['story'].append(story)
+
+            for values in choice_values:
+                choice = _load_row(Choice.__table__, values)
+                if choice['next_page_id'] not in page_ids:
+                    # Links out of the story are invalid (see app.validation) and cannot be remapped
+                    skipped_count += 1
+                    continue
+                choice['id'] = target.new_id('choice', choice['id'])
+                choice['page_id'] = page_ids[choice['page_id']]
+                choice['next_page_id'] = page_ids[choice['next_page_id']]
+                target.pending['choice'].append(choice)
+
+            target.pending['text'].extend(
+                {'hash': digest, 'data': data, 'compressed': compressed}
+                for digest, data, compressed in texts
+            )
+            target.flush()
+            story_count += 1
+            page_count += len(page_values)
+
+        for target in targets.values():
+            target.flush(force=True)
+        for target in targets.values():
+            target.session.commit()
+    except Exception:
+        for target in targets.values():
+            target.session.rollback()
+        raise
+    return story_count, page_count, skipped_count
+
+
+def init_app(app):
+    @app.cli.command('export-stories')
+    @click.argument('path', type=click.Path(dir_okay=False, writable=True))
+    def export_stories_command(path):
+        """Write the whole story catalog to a snapshot file."""
+        start = time.perf_counter()
+        with open(path, 'wb') as stream:
+            stories, pages = export_stories(stream)
+        print(f'Exported {stories} stories ({pages} pages) in {time.perf_counter() - start:.2f}s')
+
+    @app.cli.command('import-stories')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--keep-ids', is_flag=True, help='Keep the ids in the snapshot instead of renumbering.')
+    def import_stories_command(path, keep_ids):
+        """Load stories from a snapshot file written by export-stories."""
+        start = time.perf_counter()
+        with open(path, 'rb') as stream:
+            try:
+                stories, pages, skipped = import_stories(stream, keep_ids=keep_ids)
+            except ValueError as e:
+                raise click.ClickException(str(e))
+            except IntegrityError:
+                if keep_ids:
+                    raise click.ClickException(
+                        'Snapshot ids are already in use in this database; import without --keep-ids')
+                raise click.ClickException('Snapshot does not fit this database (integrity check failed)')
+        print(f'Imported {stories} stories ({pages} pages) in {time.perf_counter() - start:.2f}s')
+        if skipped:
+            print(f'Skipped {skipped} choices leading to pages of other stories')
@@ -0,0 +1,139 @@
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+# Page text is stored once per distinct content in the text_blob table, keyed
+# by SHA-256, and zlib-compressed above TEXT_COMPRESS_THRESHOLD bytes. Page
+# rows only carry the hash. Decompressed texts are kept in a small LRU;
+# entries never go stale because a hash always maps to the same text.
+
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_COMPRESS_THRESHOLD = 1024
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _encode(text, threshold):
+    data = text.encode('utf-8')
+    if len(data) > threshold:
+        compressed = zlib.compress(data, 6)
+        if len(compressed) < len(data):
+            return compressed, True
+    return data, False
+
+
+def _decode(data, compressed):
+    if compressed:
+        data = zlib.decompress(data)
+    return bytes(data).decode('utf-8')
+
+
+def _settings():
+    try:
+        config = current_app.config
+    except RuntimeError:
+        config = {}
+    return (
+        config.get('TEXT_CACHE_SIZE', DEFAULT_CACHE_SIZE),
+        config.get('TEXT_COMPRESS_THRESHOLD', DEFAULT_COMPRESS_THRESHOLD),
+    )
+
+
+def _remember(digest, text):
+    cache_size, _ = _settings()
+    with _cache_lock:
+        _cache[digest] = text
+        _cache.move_to_end(digest)
+        while len(_cache) > cache_size:
+            _cache.popitem(last=False)
+
+
+def load(session, digest):
+    """Text for `digest`, from the LRU or the text_blob table of `session`"""
+    if digest is None:
+        return None
+    with _cache_lock:
+        text = _cache.get(digest)
+        if text is not None:
+            _cache.move_to_end(digest)
+            return text
+
+    from app.models import TextBlob
+    row = session.query(TextBlob.data, TextBlob.compressed).filter_by(hash=digest).one_or_none()
+    if row is None:
+        return None
+    text = _decode(row.data, row.compressed)
+    _remember(digest, text)
+    return text
+
+
+def _store(connection, text, threshold):
+    from app.models import TextBlob
+    digest = text_hash(text)
+    data, compressed = _encode(text, threshold)
+    connection.execute(
+        insert(TextBlob.__table__)
+        .values(hash=digest, data=data, compressed=compressed)
+        .on_conflict_do_nothing(index_elements=['hash'])
+    )
+    _remember(digest, text)
+    return digest
+
+
+@event.listens_for(Session, 'before_flush')
+def _store_pending_texts(session, flush_context, instances):
+    """Write blobs for pages whose text was set since the last flush"""
+    from app.models import Page
+    _, threshold = _settings()
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Page) and obj._pending_text is not None:
+            _store(session.connection(), obj._pending_text, threshold)
+            obj._pending_text = None
+
+
+def collect_garbage(session):
+    """Delete blobs no page refers to any more; returns the number removed"""
+    from app.models import Page, TextBlob
+    used = session.query(Page.text_hash)
+    removed = session.query(TextBlob).filter(~TextBlob.hash.in_(used)).delete(synchronize_session=False)
+    session.commit()
+    return removed
+
+
+def upgrade_schema(engine, threshold=DEFAULT_COMPRESS_THRESHOLD):
+    """Move text out of page rows created before the text store existed"""
+    columns = {column['name'] for column in inspect(engine).get_columns('page')}
+    if 'text' not in columns:
+        return
+
+    with engine.begin() as connection:
+        if 'text_hash' not in columns:
+            connection.exec_driver_sql('ALTER TABLE page ADD COLUMN text_hash VARCHAR(64)')
+        rows = connection.exec_driver_sql('SELECT id, text FROM page').fetchall()
+        for page_id, text in rows:
+            digest = _store(connection, text or '', threshold)
+            connection.exec_driver_sql('UPDATE page SET text_hash = ? WHERE id = ?', (digest, page_id))
+        connection.exec_driver_sql('ALTER TABLE page DROP COLUMN text')
+
+
+def init_app(app):
+    app.config.setdefault('TEXT_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+    app.config.setdefault('TEXT_COMPRESS_THRESHOLD', DEFAULT_COMPRESS_THRESHOLD)
+
+    @app.cli.command('gc-texts')
+    def gc_texts():
+        """Remove page texts no longer referenced by any page."""
+        from app import shards
+        removed = sum(collect_garbage(session) for session in shards.all_sessions())
+        print(f'Removed {removed} unreferenced text blobs')
@@ -0,0 +1,110 @@
+import threading
+from collections import OrderedDict, defaultdict, deque
+
+from sqlalchemy.orm import aliased
+
+from app.models import CatalogVersion, Choice, Page
+
+# Whole-graph checks run before a story is published. The graph is read in one
+# query (every page of the story joined to its choices and their targets).
+# Reports are cached per story under its shard's database and catalog version,
+# which every write bumps, so a report is reused until something in that shard
+# changes.
+
+CACHE_SIZE = 1024
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _problem(code, message, **ids):
+    return dict(code=code, message=message, **ids)
+
+
+def _load_graph(session, story_id):
+    target = aliased(Page)
+    return (
+        session.query(Page.id, Page.is_ending, Choice.id, Choice.next_page_id, target.story_id)
+        .outerjoin(Choice, Choice.page_id == Page.id)
+        .outerjoin(target, target.id == Choice.next_page_id)
+        .filter(Page.story_id == story_id)
+        .all()
+    )
+
+
+def check(session, story):
+    """{'valid', 'errors', 'warnings'} for `story`; only errors block publishing"""
+    errors = []
+    warnings = []
+    is_ending = {}
+    exits = defaultdict(list)
+
+    for page_id, ending, choice_id, next_page_id, target_story_id in _load_graph(session, story.id):
+        is_ending[page_id] = bool(ending)
+        if choice_id is None:
+            continue
+        if target_story_id is None:
+            errors.append(_problem(
+                'dangling_choice', f'Choice {choice_id} leads to page {next_page_id}, which does not exist',
+                page_id=page_id, choice_id=choice_id))
+        elif target_story_id != story.id:
+            errors.append(_problem(
+                'cross_story_choice', f'Choice {choice_id} leads to page {next_page_id} of another story',
+                page_id=page_id, choice_id=choice_id))
+        else:
+            exits[page_id].append(next_page_id)
+
+    if not is_ending:
+        errors.append(_problem('no_pages', 'The story has no pages'))
+        return {'story_id': story.id, 'valid': False, 'errors': errors, 'warnings': warnings}
+
+    for page_id, ending in is_ending.items():
+        if not ending and not exits[page_id]:
+            errors.append(_problem(
+                'dead_end', f'Page {page_id} is not an ending but has no way forward', page_id=page_id))
+
+    if story.start_page_id is None:
+        errors.append(_problem('no_start_page', 'The story has no start page'))
+    elif story.start_page_id not in is_ending:
+        errors.append(_problem(
+            'bad_start_page', f'Start page {story.start_page_id} is not part of this story',
+            page_id=story.start_page_id))
+    else:
+        reachable = {story.start_page_id}
+        queue = deque(reachable)
+        while queue:
+            for next_page_id in exits[queue.popleft()]:
+                if next_page_id not in reachable:
+                    reachable.add(next_page_id)
+                    queue.append(next_page_id)
+
+        if not any(is_ending[page_id] for page_id in reachable):
+            errors.append(_problem('no_reachable_ending', 'No ending can be reached from the start page'))
+        for page_id in sorted(set(is_ending) - reachable):
+            if is_ending[page_id]:
+                errors.append(_problem(
+                    'unreachable_ending', f'Ending page {page_id} cannot be reached from the start page',
+                    page_id=page_id))
+            else:
+                warnings.append(_problem(
+                    'unreachable_page', f'Page {page_id} cannot be reached from the start page',
+                    page_id=page_id))
+
+    return {'story_id': story.id, 'valid': not errors, 'errors': errors, 'warnings': warnings}
+
+
+def report(session, story):
+    """Cached `check` result for `story`, recomputed after any catalog write"""
+    key = (str(session.get_bind().url), story.id, CatalogVersion.current(session))
+    with _cache_lock:
+        result = _cache.get(key)
+        if result is not None:
+            _cache.move_to_end(key)
+            return result
+
+    result = check(session, story)
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
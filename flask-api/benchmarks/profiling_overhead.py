@@ -0,0 +1,75 @@
+"""Per-request cost of the profiling hooks when no request is being profiled.
+
+    python benchmarks/profiling_overhead.py --requests 5000
+
+Times GET /pages/<id> through the Flask test client with profiling off (no
+PROFILE_DIR), armed (PROFILE_DIR and PROFILE_TOKEN set, request not asking
+for a profile) and sampling 1 in 1000 requests, then times the armed hooks
+on their own, since their cost is far below request-to-request noise. Runs
+against throwaway instance directories, never the real stories.db.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Response  # noqa: E402
+
+from app import create_app, profiling  # noqa: E402
+
+
+def run(label, config, requests, rounds):
+    with tempfile.TemporaryDirectory() as instance_path:
+        app = create_app(dict(config, PROFILE_DIR=config.get('PROFILE_DIR') and instance_path),
+                         instance_path=instance_path)
+        client = app.test_client()
+        story = client.post('/stories', json={'title': 'Benchmark'}).get_json()
+        page = client.post(f"/stories/{story['id']}/pages", json={'text': 'Page'}).get_json()
+        url = f"/pages/{page['id']}"
+
+        for _ in range(200):
+            client.get(url)
+        best = float('inf')
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(requests):
+                client.get(url)
+            best = min(best, (time.perf_counter() - start) / requests)
+
+    print(f'{label:>16}: {best * 1e6:8.1f} us/request')
+    return best
+
+
+def hook_cost(calls):
+    """Seconds per request spent in the profiling hooks when the request is not profiled"""
+    with tempfile.TemporaryDirectory() as instance_path:
+        app = create_app({'PROFILE_DIR': instance_path, 'PROFILE_TOKEN': 'benchmark'}, instance_path=instance_path)
+        response = Response()
+        with app.test_request_context('/pages/1'):
+            start = time.perf_counter()
+            for _ in range(calls):
+                profiling._before_request()
+                profiling._after_request(response)
+            return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=3, help='best of this many runs')
+    args = parser.parse_args()
+
+    off = run('off', {}, args.requests, args.rounds)
+    armed = run('armed', {'PROFILE_DIR': True, 'PROFILE_TOKEN': 'benchmark'}, args.requests, args.rounds)
+    sampled = run('sampling 1/1000', {'PROFILE_DIR': True, 'PROFILE_SAMPLE_RATE': 0.001},
+                  args.requests, args.rounds)
+    print(f'armed overhead: {(armed - off) * 1e6:+.1f} us ({(armed / off - 1) * 100:+.1f}%)')
+    print(f'sampling overhead: {(sampled - off) * 1e6:+.1f} us ({(sampled / off - 1) * 100:+.1f}%)')
+    print(f'armed hooks alone: {hook_cost(args.requests * 20) * 1e6:.2f} us/request')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Author write throughput with one SQLite file vs. several story shards.
+
+    python benchmarks/shard_writes.py --shards 4 --writers 8 --stories 50
+
+Each writer thread creates stories, each with a few pages and choices, through
+the HTTP API using the Flask test client. Runs against throwaway instance
+directories, never the real stories.db.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+
+
+def write_story(client, title, pages):
+    story = client.post('/stories', json={'title': title}).get_json()
+    page_ids = []
+    for i in range(pages):
+        page = client.post(f"/stories/{story['id']}/pages",
+                           json={'text': f'Page {i}', 'is_ending': i == pages - 1}).get_json()
+        page_ids.append(page['id'])
+    for current, following in zip(page_ids, page_ids[1:]):
+        client.post(f'/pages/{current}/choices', json={'text': 'Next', 'next_page_id': following})
+    return 1 + pages + (pages - 1)
+
+
+def run(shards, writers, stories, pages):
+    with tempfile.TemporaryDirectory() as instance_path:
+        app = create_app({'STORY_SHARDS': shards}, instance_path=instance_path)
+        writes = [0] * writers
+        errors = [0] * writers
+
+        def worker(n):
+            client = app.test_client()
+            for i in range(stories):
+                try:
+                    writes[n] += write_story(client, f'w{n}-s{i}', pages)
+                except Exception:
+                    errors[n] += 1
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(writers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    total = sum(writes)
+    print(f'{shards:>3} shard(s): {total} writes in {elapsed:.2f}s '
+          f'= {total / elapsed:,.0f} writes/s ({sum(errors)} failed stories)')
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--stories', type=int, default=50, help='stories per writer')
+    parser.add_argument('--pages', type=int, default=4, help='pages per story')
+    args = parser.parse_args()
+
+    single = run(1, args.writers, args.stories, args.pages)
+    sharded = run(args.shards, args.writers, args.stories, args.pages)
+    print(f'speedup: {sharded / single:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
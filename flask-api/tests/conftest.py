@@ -0,0 +1,16 @@
+import itertools
+
+import pytest
+
+from app import create_app
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build apps on throwaway instance folders, never the real stories.db"""
+    counter = itertools.count()
+
+    def make(story_shards=1, **config):
+        instance_path = tmp_path / f'instance-{next(counter)}'
+        return create_app(dict(config, STORY_SHARDS=story_shards), instance_path=str(instance_path))
+    return make
@@ -0,0 +1,108 @@
+import pytest
+
+from app import db
+from app.models import Page
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def story_id(client):
+    return client.post('/stories', json={'title': 'Story'}).get_json()['id']
+
+
+def patch(client, story_id, *operations, **body):
+    return client.patch(f'/stories/{story_id}/graph', json=dict(body, operations=list(operations)))
+
+
+def page_texts(app, story_id):
+    with app.app_context():
+        return sorted(page.text for page in db.session.query(Page).filter_by(story_id=story_id))
+
+
+def build(client, story_id):
+    """Start -> Middle -> End; returns {ref: page id}"""
+    response = patch(
+        client, story_id,
+        {'op': 'create', 'type': 'page', 'ref': 'start', 'text': 'Start'},
+        {'op': 'create', 'type': 'page', 'ref': 'middle', 'text': 'Middle'},
+        {'op': 'create', 'type': 'page', 'ref': 'end', 'text': 'End', 'is_ending': True},
+        {'op': 'create', 'type': 'choice', 'page_id': 'start', 'next_page_id': 'middle', 'text': 'On'},
+        {'op': 'create', 'type': 'choice', 'page_id': 'middle', 'next_page_id': 'end', 'text': 'On'},
+    )
+    assert response.status_code == 200
+    return response.get_json()['created']
+
+
+def test_batch_creates_linked_pages(client, story_id):
+    refs = build(client, story_id)
+    story = client.get(f'/stories/{story_id}').get_json()
+    assert story['start_page_id'] == refs['start']
+    assert client.get(f'/stories/{story_id}/validation').get_json()['valid']
+
+
+def test_failing_operation_rolls_back_the_batch(app, client, story_id):
+    refs = build(client, story_id)
+    response = patch(
+        client, story_id,
+        {'op': 'create', 'type': 'page', 'ref': 'extra', 'text': 'Extra'},
+        {'op': 'update', 'type': 'page', 'id': refs['start'], 'text': 'Changed'},
+        {'op': 'delete', 'type': 'page', 'id': 999999},
+    )
+    assert response.status_code == 400
+    assert page_texts(app, story_id) == ['End', 'Middle', 'Start']
+
+
+def test_malformed_body_is_rejected(client, story_id):
+    assert client.patch(f'/stories/{story_id}/graph', json=[{'op': 'create'}]).status_code == 400
+    assert patch(client, story_id, {'op': 'rename', 'type': 'page'}).status_code == 400
+    assert patch(client, story_id, {'op': 'create', 'type': 'page', 'text': 3}).status_code == 400
+
+
+def test_page_delete_cascades_to_choices(app, client, story_id):
+    refs = build(client, story_id)
+    response = patch(client, story_id, {'op': 'delete', 'type': 'page', 'id': refs['middle']})
+    assert response.status_code == 200
+
+    assert page_texts(app, story_id) == ['End', 'Start']
+    # Start's only choice led to the deleted page, so it went too
+    assert client.get(f"/pages/{refs['start']}").get_json()['choices'] == []
+    errors = client.get(f'/stories/{story_id}/validation').get_json()['errors']
+    assert 'dangling_choice' not in [problem['code'] for problem in errors]
+
+
+def test_single_page_delete_cascades_and_unpublishes(client, story_id):
+    refs = build(client, story_id)
+    assert client.put(f'/stories/{story_id}', json={'status': 'published'}).status_code == 200
+
+    response = client.delete(f"/pages/{refs['middle']}")
+    assert response.status_code == 204
+    assert response.headers['X-Story-Status'] == 'draft'
+    assert client.get(f"/pages/{refs['start']}").get_json()['choices'] == []
+    assert client.get(f'/stories/{story_id}').get_json()['status'] == 'draft'
+
+
+def test_published_story_rejects_breaking_batch(app, client, story_id):
+    refs = build(client, story_id)
+    assert client.put(f'/stories/{story_id}', json={'status': 'published'}).status_code == 200
+
+    response = patch(client, story_id, {'op': 'create', 'type': 'page', 'text': 'Dead end'})
+    assert response.status_code == 400
+    assert [p['code'] for p in response.get_json()['validation']['errors']] == ['dead_end']
+    assert page_texts(app, story_id) == ['End', 'Middle', 'Start']
+    assert client.get(f'/stories/{story_id}').get_json()['status'] == 'published'
+
+    response = patch(
+        client, story_id,
+        {'op': 'create', 'type': 'page', 'ref': 'alt', 'text': 'Alternate end', 'is_ending': True},
+        {'op': 'create', 'type': 'choice', 'page_id': refs['start'], 'next_page_id': 'alt', 'text': 'Skip'},
+    )
+    assert response.status_code == 200
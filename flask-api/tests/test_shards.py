@@ -0,0 +1,72 @@
+import pytest
+
+from app import shards
+from app.models import Choice, Page, Story
+
+SHARDS = 3
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(SHARDS)
+
+
+def test_insert_keeps_shard_residue(app):
+    with app.app_context():
+        for _ in range(3):
+            for shard in range(SHARDS):
+                story = shards.insert(shards.session_for_shard(shard), Story(title='Story'), shard)
+                assert story.id % SHARDS == shard
+                page = shards.insert(shards.session_for_shard(shard), Page(story_id=story.id, text='Page'), shard)
+                assert page.id % SHARDS == shard
+                assert shards.session_for(page.id).get(Page, page.id).story_id == story.id
+
+
+def test_insert_ids_are_unique_per_shard(app):
+    with app.app_context():
+        session = shards.session_for_shard(1)
+        ids = [shards.insert(session, Story(title=f'Story {i}'), 1).id for i in range(5)]
+        assert ids == sorted(set(ids))
+        assert all(id % SHARDS == 1 for id in ids)
+
+
+def test_add_allocates_in_one_transaction(app):
+    with app.app_context():
+        story = shards.insert(shards.session_for_shard(2), Story(title='Story'), 2)
+        session = shards.session_for(story.id)
+        shards.lock_for_write(session)
+        pages = [shards.add(session, Page(story_id=story.id, text=f'Page {i}'), 2) for i in range(4)]
+        choice = shards.add(session, Choice(page_id=pages[0].id, next_page_id=pages[1].id, text='Go'), 2)
+        session.commit()
+
+        ids = [page.id for page in pages]
+        assert len(set(ids)) == 4
+        assert all(id % SHARDS == 2 for id in ids + [choice.id])
+
+
+def test_routes_create_rows_in_the_story_shard(app):
+    client = app.test_client()
+    created = []
+    for i in range(SHARDS * 2):
+        story = client.post('/stories', json={'title': f'Story {i}', 'status': 'draft'}).get_json()
+        start = client.post(f"/stories/{story['id']}/pages", json={'text': 'Start'}).get_json()
+        end = client.post(f"/stories/{story['id']}/pages", json={'text': 'End', 'is_ending': True}).get_json()
+        choice = client.post(f"/pages/{start['id']}/choices",
+                             json={'text': 'Go', 'next_page_id': end['id']}).get_json()
+        assert start['id'] % SHARDS == end['id'] % SHARDS == choice['id'] % SHARDS == story['id'] % SHARDS
+        created.append((story, start))
+
+    assert {story['id'] % SHARDS for story, _ in created} == set(range(SHARDS))
+    for story, start in created:
+        assert client.get(f"/stories/{story['id']}").get_json()['title'] == story['title']
+        assert client.get(f"/stories/{story['id']}/start").get_json()['id'] == start['id']
+    assert len(client.get('/stories').get_json()) == len(created)
+
+
+def test_single_shard_uses_default_session(make_app):
+    app = make_app(1)
+    with app.app_context():
+        from app import db
+        assert shards.session_for(7) is db.session
+        story = shards.insert(db.session, Story(title='Story'), 0)
+        assert db.session.get(Story, story.id) is not None
@@ -0,0 +1,143 @@
+import io
+
+import pytest
+
+from app import db, shards, snapshot
+from app.models import Choice, Page, Story
+
+
+def build_story(client, title):
+    """Start page with two choices, one to an ending and one to a page looping back"""
+    story = client.post('/stories', json={'title': title, 'description': 'About ' + title,
+                                          'status': 'draft'}).get_json()
+    start = client.post(f"/stories/{story['id']}/pages", json={'text': f'{title} begins'}).get_json()
+    loop = client.post(f"/stories/{story['id']}/pages", json={'text': f'{title} loops'}).get_json()
+    end = client.post(f"/stories/{story['id']}/pages",
+                      json={'text': f'{title} ends', 'is_ending': True, 'ending_label': 'The end'}).get_json()
+    client.post(f"/pages/{start['id']}/choices", json={'text': 'Loop', 'next_page_id': loop['id']})
+    client.post(f"/pages/{start['id']}/choices", json={'text': 'Finish', 'next_page_id': end['id']})
+    client.post(f"/pages/{loop['id']}/choices", json={'text': 'Back', 'next_page_id': start['id']})
+    return story['id']
+
+
+def catalog(app):
+    """Every story as ids-free nested data, plus the raw ids by story title"""
+    stories = {}
+    ids = {}
+    with app.app_context():
+        for session in shards.all_sessions():
+            for story in session.query(Story).all():
+                pages = session.query(Page).filter_by(story_id=story.id).order_by(Page.id).all()
+                text_of = {page.id: page.text for page in pages}
+                choices = (
+                    session.query(Choice).join(Page, Page.id == Choice.page_id)
+                    .filter(Page.story_id == story.id).order_by(Choice.id).all()
+                )
+                stories[story.title] = {
+                    'description': story.description,
+                    'status': story.status,
+                    'start': text_of.get(story.start_page_id),
+                    'pages': sorted((page.text, page.is_ending, page.ending_label) for page in pages),
+                    'choices': sorted((text_of[c.page_id], c.text, text_of[c.next_page_id]) for c in choices),
+                }
+                ids[story.title] = {
+                    'story': story.id,
+                    'rows': [page.id for page in pages] + [choice.id for choice in choices],
+                }
+    return stories, ids
+
+
+def export(app):
+    stream = io.BytesIO()
+    with app.app_context():
+        snapshot.export_stories(stream)
+    stream.seek(0)
+    return stream
+
+
+@pytest.fixture
+def source(make_app):
+    app = make_app()
+    client = app.test_client()
+    for title in ('Caves', 'Castles', 'Comets'):
+        build_story(client, title)
+    return app
+
+
+def test_round_trip_keeps_ids(source, make_app):
+    target = make_app()
+    with target.app_context():
+        assert snapshot.import_stories(export(source), keep_ids=True) == (3, 9, 0)
+    assert catalog(target) == catalog(source)
+
+
+def test_import_renumbers_after_existing_rows(source, make_app):
+    target = make_app()
+    build_story(target.test_client(), 'Existing')
+    with target.app_context():
+        snapshot.import_stories(export(source))
+
+    stories, ids = catalog(target)
+    expected, _ = catalog(source)
+    assert {title: stories[title] for title in expected} == expected
+    assert ids['Existing']['story'] not in {ids[title]['story'] for title in expected}
+    assert all(min(ids[title]['rows']) > max(ids['Existing']['rows']) for title in expected)
+
+
+def test_import_into_shards_keeps_residues(source, make_app):
+    target = make_app(3)
+    with target.app_context():
+        snapshot.import_stories(export(source))
+
+    stories, ids = catalog(target)
+    assert stories == catalog(source)[0]
+    assert {story_ids['story'] % 3 for story_ids in ids.values()} == {0, 1, 2}
+    for story_ids in ids.values():
+        assert {id % 3 for id in story_ids['rows']} == {story_ids['story'] % 3}
+
+
+def test_rejects_other_files(make_app):
+    app = make_app()
+    with app.app_context(), pytest.raises(ValueError, match='Not a story snapshot'):
+        snapshot.import_stories(io.BytesIO(b'definitely not msgpack'))
+
+
+def test_cli_keep_ids_conflict_is_a_clean_error(source, tmp_path):
+    path = tmp_path / 'catalog.snapshot'
+    path.write_bytes(export(source).getvalue())
+
+    result = source.test_cli_runner().invoke(args=['import-stories', str(path), '--keep-ids'])
+    assert result.exit_code == 1
+    assert 'already in use' in result.output
+    assert result.exception is None or isinstance(result.exception, SystemExit)
+
+    result = source.test_cli_runner().invoke(args=['import-stories', str(path)])
+    assert result.exit_code == 0, result.output
+    with source.app_context():
+        assert len(shards.query_all(Story)) == 6
+
+
+def test_cli_reads_files_and_reports_skipped_choices(source, make_app, tmp_path):
+    with source.app_context():
+        caves, comets = (db.session.query(Story).filter_by(title=title).one() for title in ('Caves', 'Comets'))
+        # Only possible in data written before choices were checked
+        db.session.add(Choice(page_id=caves.start_page_id, text='Away', next_page_id=comets.start_page_id))
+        db.session.commit()
+    path = tmp_path / 'catalog.snapshot'
+    path.write_bytes(export(source).getvalue())
+
+    target = make_app()
+    result = target.test_cli_runner().invoke(args=['import-stories', str(path)])
+    assert result.exit_code == 0, result.output
+    assert 'Imported 3 stories (9 pages)' in result.output
+    assert 'Skipped 1 choices leading to pages of other stories' in result.output
+    assert 'Away' not in [text for _, text, _ in catalog(target)[0]['Caves']['choices']]
+
+
+def test_truncated_file_is_rejected(source, make_app, tmp_path):
+    path = tmp_path / 'catalog.snapshot'
+    path.write_bytes(export(source).getvalue()[:-10])
+
+    result = make_app().test_cli_runner().invoke(args=['import-stories', str(path)])
+    assert result.exit_code == 1
+    assert 'Truncated snapshot' in result.output
@@ -0,0 +1,106 @@
+import pytest
+
+from app import db
+from app.models import Choice
+
+
+@pytest.fixture
+def client(make_app):
+    return make_app().test_client()
+
+
+def make_story(client, *pages):
+    """Draft story with one page per `(text, is_ending)`; the first is the start page"""
+    story = client.post('/stories', json={'title': 'Story'}).get_json()
+    ids = [
+        client.post(f"/stories/{story['id']}/pages", json={'text': text, 'is_ending': ending}).get_json()['id']
+        for text, ending in pages
+    ]
+    return story['id'], ids
+
+
+def link(client, from_id, to_id):
+    response = client.post(f'/pages/{from_id}/choices', json={'text': 'Go', 'next_page_id': to_id})
+    assert response.status_code == 201
+    return response
+
+
+def codes(client, story_id):
+    report = client.get(f'/stories/{story_id}/validation').get_json()
+    return [problem['code'] for problem in report['errors']], [problem['code'] for problem in report['warnings']]
+
+
+def test_valid_story(client):
+    story_id, (start, end) = make_story(client, ('Start', False), ('End', True))
+    link(client, start, end)
+    assert codes(client, story_id) == ([], [])
+
+
+def test_dead_end(client):
+    story_id, (start, middle, end) = make_story(client, ('Start', False), ('Middle', False), ('End', True))
+    link(client, start, middle)
+    link(client, start, end)
+    report = client.get(f'/stories/{story_id}/validation').get_json()
+    assert not report['valid']
+    assert [(p['code'], p['page_id']) for p in report['errors']] == [('dead_end', middle)]
+
+
+def test_cross_story_choice(make_app):
+    app = make_app()
+    client = app.test_client()
+    story_id, (start, end) = make_story(client, ('Start', False), ('End', True))
+    _, (other,) = make_story(client, ('Elsewhere', True))
+    link(client, start, end)
+    assert client.post(f'/pages/{start}/choices', json={'text': 'Away', 'next_page_id': other}).status_code == 400
+
+    # Older rows can still point across stories; the report must catch them
+    with app.app_context():
+        db.session.add(Choice(page_id=start, text='Away', next_page_id=other))
+        db.session.commit()
+    assert codes(client, story_id) == (['cross_story_choice'], [])
+
+
+def test_unreachable_ending_and_page(client):
+    story_id, (start, end, lost_end, lost_page) = make_story(
+        client, ('Start', False), ('End', True), ('Lost end', True), ('Lost page', False))
+    link(client, start, end)
+    link(client, lost_page, lost_end)
+    assert codes(client, story_id) == (['unreachable_ending'], ['unreachable_page'])
+
+
+def test_publish_is_rejected_with_the_report(client):
+    story_id, (start, end) = make_story(client, ('Start', False), ('End', True))
+    response = client.put(f'/stories/{story_id}', json={'status': 'published'})
+    assert response.status_code == 400
+    assert 'dead_end' in [p['code'] for p in response.get_json()['validation']['errors']]
+    assert client.get(f'/stories/{story_id}').get_json()['status'] == 'draft'
+
+    link(client, start, end)
+    assert client.put(f'/stories/{story_id}', json={'status': 'published'}).status_code == 200
+
+
+def test_new_stories_cannot_start_published(client):
+    response = client.post('/stories', json={'title': 'Story', 'status': 'published'})
+    assert response.status_code == 400
+
+
+def test_page_add_moves_published_story_to_draft(client):
+    story_id, (start, end) = make_story(client, ('Start', False), ('End', True))
+    link(client, start, end)
+    assert client.put(f'/stories/{story_id}', json={'status': 'published'}).status_code == 200
+
+    # A new non-ending page is a dead end until a choice leads on from it
+    response = client.post(f'/stories/{story_id}/pages', json={'text': 'Detour'})
+    assert response.status_code == 201
+    assert response.headers['X-Story-Status'] == 'draft'
+    assert client.get(f'/stories/{story_id}').get_json()['status'] == 'draft'
+
+
+def test_valid_edit_keeps_story_published(client):
+    story_id, (start, end) = make_story(client, ('Start', False), ('End', True))
+    link(client, start, end)
+    client.put(f'/stories/{story_id}', json={'status': 'published'})
+
+    response = client.put(f'/pages/{start}', json={'text': 'A new beginning'})
+    assert 'X-Story-Status' not in response.headers
+    assert client.get(f'/stories/{story_id}').get_json()['status'] == 'published'